@@ -0,0 +1,219 @@
+import queue
+import time
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from agent import DQNAgent, select_actions
+from env import VectorChessEnv
+from inference import InferenceServer
+from model import build_net, save_checkpoint
+
+class SharedWeights:
+    """
+    Cópia dos pesos da rede em memória partilhada entre processos.
+    O learner escreve os pesos novos e incrementa a versão; cada ator só
+    copia os tensores partilhados para a sua rede quando a versão muda.
+    Nada é serializado com pickle depois de os processos arrancarem.
+    """
+    def __init__(self, net, ctx=mp):
+        self.net = build_net(net.head)
+        self.net.load_state_dict(net.state_dict())
+        self.net.share_memory()
+        self.version = ctx.Value("i", 0)
+        self.lock = ctx.Lock()
+
+    def publish(self, net):
+        with self.lock, torch.no_grad():
+            for shared, param in zip(self.net.parameters(), net.parameters()):
+                shared.copy_(param.detach())
+            self.version.value += 1
+
+    def pull(self, net, known_version):
+        """Atualiza `net` se houver pesos mais recentes. Devolve a versão atual."""
+        version = self.version.value
+        if version != known_version:
+            with self.lock, torch.no_grad():
+                for param, shared in zip(net.parameters(), self.net.parameters()):
+                    param.copy_(shared)
+                version = self.version.value
+        return version
+
+def actor_epsilon(actor_id, num_actors, base=0.4, alpha=7.0):
+    """
+    Cada ator explora com um epsilon fixo diferente (esquema do Ape-X), em vez
+    do decaimento por episódio do train.py: uns atores exploram muito, outros
+    jogam quase sempre a melhor jogada.
+    """
+    if num_actors == 1:
+        return base
+    return base ** (1 + alpha * actor_id / (num_actors - 1))
+
+def actor_loop(actor_id, num_actors, weights, transitions, stop, num_envs, chunk_size, sync_every, seed,
+               client=None):
+    """
+    Processo ator: joga contra o oponente aleatório com uma cópia da rede em
+    CPU e envia as transições em blocos pela fila (os tensores vão para
+    memória partilhada, não são copiados com pickle).
+    Com um InferenceClient, as jogadas são pedidas ao servidor de inferência
+    do learner em vez de usar a cópia local da rede.
+    """
+    torch.set_num_threads(1)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    net = build_net(weights.net.head)
+    net.eval()
+    version = weights.pull(net, -1)
+    epsilon = actor_epsilon(actor_id, num_actors)
+
+    envs = VectorChessEnv(num_envs, seed=seed, promotions=weights.net.head == "compact")
+    states, masks = envs.reset()
+
+    chunk = []
+    steps = 0
+    games = 0 # Jogos terminados ainda não enviados ao learner
+    while not stop.is_set():
+        if client is not None:
+            actions = client.select_actions(states, masks, epsilon)
+        else:
+            actions = select_actions(net, states, masks, epsilon)
+        next_states, rewards, dones, next_masks = envs.step(actions)
+        chunk.append((states.astype(np.uint8), actions, rewards, next_states.astype(np.uint8), dones, next_masks))
+        states, masks = envs.states, envs.masks
+        steps += 1
+
+        if len(chunk) * num_envs >= chunk_size:
+            block = [torch.from_numpy(np.concatenate(field)) for field in zip(*chunk)]
+            games += len(envs.pop_finished())
+            try:
+                transitions.put((actor_id, games, block), timeout=1.0)
+                games = 0
+            except queue.Full:
+                # O learner está atrasado: descartar este bloco em vez de bloquear o ator
+                # (os jogos terminados continuam a contar e vão no próximo bloco enviado)
+                pass
+            chunk = []
+
+        if client is None and steps % sync_every == 0:
+            version = weights.pull(net, version)
+
+class ThroughputMeter:
+    """Contadores de jogos, transições e atualizações, com taxas por segundo"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.counts = {"jogos": 0, "transições": 0, "atualizações": 0}
+        self.last_counts = dict(self.counts)
+
+    def add(self, name, n=1):
+        self.counts[name] += n
+
+    def report(self):
+        now = time.perf_counter()
+        elapsed = max(now - self.last, 1e-9)
+        rates = {k: (v - self.last_counts[k]) / elapsed for k, v in self.counts.items()}
+        self.last, self.last_counts = now, dict(self.counts)
+        return rates
+
+def train_distributed(episodes=500, num_actors=2, envs_per_actor=1, chunk_size=64,
+                      publish_every=50, sync_every=20, report_every=10.0, seed=0,
+                      central_inference=False, max_batch=64, max_wait_ms=2.0):
+    """
+    Modo ator/learner: `num_actors` processos geram jogos em paralelo
+    (a geração de jogadas do python-chess não liberta o GIL) e o processo
+    principal treina a rede com as transições que vão chegando.
+    Com central_inference, os atores não têm rede própria: as jogadas são
+    calculadas em lote por um InferenceServer no processo do learner.
+    """
+    ctx = mp.get_context("spawn")
+    agent = DQNAgent(device="cuda" if torch.cuda.is_available() else "cpu")
+    weights = SharedWeights(agent.policy_net, ctx)
+
+    server = None
+    clients = [None] * num_actors
+    if central_inference:
+        server_net = build_net(agent.head).to(agent.device)
+        server_net.load_state_dict(agent.policy_net.state_dict())
+        server_net.eval()
+        server = InferenceServer(server_net, agent.device, max_batch, max_wait_ms, ctx=ctx)
+        clients = [server.connect() for _ in range(num_actors)]
+        server.start()
+
+    transitions = ctx.Queue(maxsize=4 * num_actors)
+    stop = ctx.Event()
+    actors = [ctx.Process(target=actor_loop, daemon=True,
+                          args=(i, num_actors, weights, transitions, stop, envs_per_actor,
+                                chunk_size, sync_every, seed + i, clients[i]))
+              for i in range(num_actors)]
+    for p in actors:
+        p.start()
+    print(f"A treinar usando o dispositivo: {agent.device} ({num_actors} atores)")
+
+    meter = ThroughputMeter()
+    last_report = time.perf_counter()
+    episode = 0
+    updates = 0
+    try:
+        while episode < episodes:
+            # Esvaziar a fila sem bloquear; só espera se ainda não houver dados
+            try:
+                block = transitions.get(timeout=None if len(agent.memory) < agent.batch_size else 0.0)
+            except queue.Empty:
+                block = None
+            while block is not None:
+                actor_id, games, tensors = block
+                agent.memory.push_batch(*(t.numpy() for t in tensors))
+                meter.add("transições", len(tensors[1]))
+                meter.add("jogos", games)
+                for _ in range(games):
+                    # Atualizar a Rede Alvo a cada 10 episódios, como no train.py
+                    if episode % 10 == 0:
+                        agent.update_target_network()
+                    episode += 1
+                try:
+                    block = transitions.get_nowait()
+                except queue.Empty:
+                    block = None
+
+            if len(agent.memory) >= agent.batch_size:
+                agent.optimize_model()
+                updates += 1
+                meter.add("atualizações")
+                if updates % publish_every == 0:
+                    if server is not None:
+                        server.load_state_dict(agent.policy_net.state_dict())
+                    else:
+                        weights.publish(agent.policy_net)
+
+            if time.perf_counter() - last_report >= report_every:
+                rates = meter.report()
+                last_report = time.perf_counter()
+                print(f"Episódios={episode} | jogos/s={rates['jogos']:.2f} "
+                      f"transições/s={rates['transições']:.1f} atualizações/s={rates['atualizações']:.2f} "
+                      f"| replay={len(agent.memory)}")
+                if server is not None:
+                    stats = server.stats()
+                    print(f"Inferência: p50={stats['p50_ms']:.2f} ms p99={stats['p99_ms']:.2f} ms "
+                          f"lotes={stats['batch_sizes']}")
+    finally:
+        stop.set()
+        # Esvaziar a fila enquanto os atores terminam (um put pendente bloqueia o ator)
+        deadline = time.perf_counter() + 10.0
+        while any(p.is_alive() for p in actors) and time.perf_counter() < deadline:
+            try:
+                transitions.get(timeout=0.1)
+            except (queue.Empty, OSError):
+                # Blocos de atores que já saíram deixam de poder ser lidos
+                pass
+        for p in actors:
+            if p.is_alive():
+                p.terminate()
+            p.join()
+        if server is not None:
+            server.stop()
+
+    save_checkpoint(agent.policy_net, "chess_dqn.pth")
+    print("Treino concluído. Modelo guardado.")
+    return meter.counts
@@ -3,106 +3,265 @@ import torch.nn as nn
 import torch.optim as optim
 import numpy as np
 import random
-from collections import deque
-from model import ChessDQN
+from model import build_net
+from env import NUM_ACTIONS, NUM_PROMOTION_ACTIONS, legal_mask as build_legal_mask
+from replay import ReplayBuffer, CompactReplayBuffer, PrioritizedReplayBuffer
+from cache import PositionCache
+from profiling import profiler
 
-class ReplayBuffer:
-    def __init__(self, capacity):
-        self.buffer = deque(maxlen=capacity)
-        
-    def push(self, state, action, reward, next_state, done):
-        self.buffer.append((state, action, reward, next_state, done))
-        
-    def sample(self, batch_size):
-        batch = random.sample(self.buffer, batch_size)
-        state, action, reward, next_state, done = zip(*batch)
-        return np.array(state), action, reward, np.array(next_state), done
-        
-    def __len__(self):
-        return len(self.buffer)
+def epsilon_greedy(states, legal_masks, epsilon, greedy_fn):
+    """
+    Epsilon-greedy em lote: as linhas que exploram escolhem uma jogada legal
+    ao acaso e as restantes são avaliadas todas juntas por greedy_fn(states, masks).
+    """
+    n = len(states)
+    explore = np.random.random(n) < epsilon
+    actions = np.zeros(n, dtype=np.int64)
+
+    for i in np.flatnonzero(explore):
+        actions[i] = np.random.choice(np.flatnonzero(legal_masks[i]))
+
+    greedy = np.flatnonzero(~explore)
+    if len(greedy):
+        actions[greedy] = greedy_fn(states[greedy], legal_masks[greedy])
+    return actions
+
+def masked_argmax(net, states, legal_masks, device="cpu"):
+    """Melhor jogada legal de cada tabuleiro, com uma só forward pass"""
+    with torch.no_grad():
+        q_values = net(torch.from_numpy(states).float().to(device))
+        mask = torch.from_numpy(legal_masks).to(device)
+        return q_values.masked_fill(~mask, -float('inf')).argmax(1).cpu().numpy()
+
+def select_actions(net, states, legal_masks, epsilon, device="cpu"):
+    """
+    Epsilon-greedy em lote com uma rede qualquer (também usado pelos atores,
+    que só têm uma cópia da rede e não o DQNAgent completo).
+    """
+    return epsilon_greedy(states, legal_masks, epsilon,
+                          lambda s, m: masked_argmax(net, s, m, device))
 
 class DQNAgent:
-    def __init__(self, device="cpu"):
+    def __init__(self, device="cpu", memory_size=10000, compact_memory=False, batch_size=64,
+                 grad_accum_steps=1, target_tau=None, target_update_steps=None,
+                 amp_dtype=None, channels_last=False, compile_model=False, cache_size=0,
+                 prioritized=False, per_alpha=0.6, per_beta=0.4, head="dense"):
         self.device = torch.device(device)
+        # Cabeça de ação: "dense" (ChessDQN, 4096 saídas) ou "compact" (LegalMoveDQN,
+        # que só avalia as jogadas pedidas e distingue as sub-promoções). A compacta
+        # usa a codificação com promoções: o ambiente tem de ser criado com
+        # ChessEnv(promotions=agent.promotions)
+        self.head = head
+        self.promotions = head == "compact"
+        self.num_actions = NUM_PROMOTION_ACTIONS if self.promotions else NUM_ACTIONS
         # Rede que toma as ações
-        self.policy_net = ChessDQN().to(self.device)
+        self.policy_net = build_net(head).to(self.device)
         # Rede Alvo (Target) estabiliza o treino (atualizada a cada N passos)
-        self.target_net = ChessDQN().to(self.device)
+        self.target_net = build_net(head).to(self.device)
         self.target_net.load_state_dict(self.policy_net.state_dict())
         self.target_net.eval()
+
+        # Caminho rápido opcional: precisão mista (bf16 também funciona em CPU),
+        # layout channels-last para as convoluções e torch.compile
+        self.amp_dtype = getattr(torch, amp_dtype) if isinstance(amp_dtype, str) else amp_dtype
+        self.channels_last = channels_last
+        if channels_last:
+            self.policy_net.to(memory_format=torch.channels_last)
+            self.target_net.to(memory_format=torch.channels_last)
+        # As versões compiladas só são usadas no treino; os pesos continuam em policy_net/target_net
+        self._policy_forward = self.policy_net
+        self._target_forward = self.target_net
+        if compile_model and hasattr(torch, "compile"):
+            self._policy_forward = torch.compile(self.policy_net)
+            self._target_forward = torch.compile(self.target_net)
+        # Em fp16 os gradientes pequenos perdem-se sem escalar a perda (bf16 não precisa)
+        self.scaler = None
+        if self.amp_dtype == torch.float16 and self.device.type == "cuda":
+            self.scaler = torch.amp.GradScaler("cuda")
         
         self.optimizer = optim.Adam(self.policy_net.parameters(), lr=1e-4) # Learning rate modesto
-        self.memory = ReplayBuffer(10000) # Capacidade do buffer (quantas jogadas passadas recorda para treinar)
-        self.batch_size = 64
+        # Capacidade do buffer (quantas jogadas passadas recorda para treinar)
+        # A versão compacta guarda os tabuleiros em bitboards, para milhões de transições
+        # A versão com prioridades sorteia mais vezes as transições com maior erro TD
+        # (as recompensas raras de fim de jogo e capturas)
+        pin_memory = self.device.type == "cuda"
+        if prioritized:
+            if compact_memory:
+                raise ValueError("prioritized=True ainda não suporta compact_memory=True")
+            self.memory = PrioritizedReplayBuffer(memory_size, device=self.device, pin_memory=pin_memory,
+                                                  alpha=per_alpha, beta=per_beta, num_actions=self.num_actions)
+        elif compact_memory:
+            # Com as máscaras: o max do alvo só conta as jogadas legais, como no ReplayBuffer
+            self.memory = CompactReplayBuffer(memory_size, device=self.device, pin_memory=pin_memory,
+                                              store_masks=True, num_actions=self.num_actions)
+        else:
+            self.memory = ReplayBuffer(memory_size, device=self.device, pin_memory=pin_memory,
+                                       num_actions=self.num_actions)
+        self.batch_size = batch_size
         self.gamma = 0.99
+
+        # Cada passo de gradiente acumula grad_accum_steps mini-lotes de batch_size
+        # (lote efetivo maior sem aumentar a memória de ativações)
+        self.grad_accum_steps = grad_accum_steps
+        # Atualização da rede alvo: suave (Polyak, com tau), a cada N passos de
+        # gradiente, ou (se nenhum for dado) pelo train.py a cada 10 episódios
+        self.target_tau = target_tau
+        self.target_update_steps = target_update_steps
+        self.updates = 0 # Passos de gradiente feitos
+
+        # Cache de avaliações por posição (chave Zobrist), invalidada a cada passo de gradiente.
+        # Quem carregar pesos com load_state_dict deve chamar cache.clear().
+        self.cache = PositionCache(cache_size) if cache_size else None
+
+    def legal_q_values(self, state, legal_mask, position_key=None):
+        """
+        Q-values das jogadas legais: devolve (índices das ações, Q-values).
+        Com a cache ativa e uma chave de posição, repetições e transposições
+        não voltam a passar pela rede.
+        """
+        def compute():
+            with torch.no_grad():
+                state_tensor = torch.from_numpy(state).float().unsqueeze(0).to(self.device)
+                q_values = self.policy_net(state_tensor).squeeze(0)
+                actions = np.flatnonzero(legal_mask)
+                return actions, q_values[torch.from_numpy(actions).to(self.device)].cpu().numpy()
+
+        if self.cache is None or position_key is None:
+            return compute()
+        return self.cache.get_or_compute(position_key, self.updates, compute)
         
-    def select_action(self, state, legal_actions, epsilon):
+    def select_action(self, state, legal_actions, epsilon, legal_mask=None, position_key=None):
         if not legal_actions:
             return None
             
         if random.random() < epsilon:
             # Explorar
-            return random.choice(legal_actions)[0]
+            return random.choice(list(legal_actions))
+
+        if self.cache is not None and position_key is not None:
+            if legal_mask is None:
+                legal_mask = build_legal_mask(legal_actions, self.num_actions)
+            actions, q_values = self.legal_q_values(state, legal_mask, position_key)
+            return int(actions[np.argmax(q_values)])
             
         # Exploração Avarenta (Greedy)
         with torch.no_grad():
             state_tensor = torch.FloatTensor(state).unsqueeze(0).to(self.device)
-            # Retorna o Q-value previso para todas as 4096 ações possíveis
+            # Retorna o Q-value previso para todas as ações possíveis (4096 na cabeça densa)
             q_values = self.policy_net(state_tensor).squeeze(0) 
             
-            best_action = None
-            best_q = -float('inf')
-            
-            # Masking the actions: Procuramos a melhor ação, APENAS dentro das válidas
-            for action_idx, move in legal_actions:
-                q = q_values[action_idx].item()
-                if q > best_q:
-                    best_q = q
-                    best_action = action_idx
-                    
-            return best_action
+            # Masking the actions: Procuramos a melhor ação, APENAS dentro das válidas,
+            # com um único argmax no dispositivo (sem sincronizar por cada jogada)
+            if legal_mask is None:
+                legal_mask = build_legal_mask(legal_actions, self.num_actions)
+            mask = torch.from_numpy(legal_mask).to(self.device)
+            return q_values.masked_fill(~mask, -float('inf')).argmax().item()
             
-    def store_transition(self, state, action, reward, next_state, done):
-        self.memory.push(state, action, reward, next_state, done)
+    def select_actions(self, states, legal_masks, epsilon):
+        """
+        Versão em lote de select_action para o VectorChessEnv: escolhe uma
+        jogada para cada um dos N tabuleiros com uma única forward pass.
+        """
+        return select_actions(self.policy_net, states, legal_masks, epsilon, self.device)
+
+    def store_transition(self, state, action, reward, next_state, done, next_mask=None):
+        self.memory.push(state, action, reward, next_state, done, next_mask)
         
     def update_target_network(self):
         self.target_net.load_state_dict(self.policy_net.state_dict())
+
+    def soft_update_target_network(self, tau):
+        """Polyak: target = (1 - tau) * target + tau * policy"""
+        with torch.no_grad():
+            for target_param, param in zip(self.target_net.parameters(), self.policy_net.parameters()):
+                target_param.lerp_(param, tau)
+
+    @property
+    def updates_target_by_steps(self):
+        """True se a rede alvo é atualizada aqui (e não por episódios no train.py)"""
+        return self.target_tau is not None or self.target_update_steps is not None
+
+    def _compute_loss(self, batch):
+        """Devolve a perda do lote e os erros TD de cada transição (para as prioridades)"""
+        states, actions, rewards, next_states, dones, next_masks, weights, _ = batch
+        actions = actions.unsqueeze(1)
+        if self.channels_last:
+            states = states.contiguous(memory_format=torch.channels_last)
+            next_states = next_states.contiguous(memory_format=torch.channels_last)
+
+        with torch.autocast(self.device.type, dtype=self.amp_dtype, enabled=self.amp_dtype is not None):
+            # Calcular os Q(s, a) atuais (a perda é sempre calculada em fp32);
+            # a cabeça compacta avalia só a jogada feita em cada estado
+            if self.head == "compact":
+                state_action_values = self.policy_net.score_actions(states, actions.squeeze(1)).float()
+            else:
+                state_action_values = self._policy_forward(states).gather(1, actions).squeeze(1).float()
+            with torch.no_grad():
+                next_q_values = self._target_forward(next_states).float()
         
-    def optimize_model(self):
-        if len(self.memory) < self.batch_size:
-            return 0.0
-            
-        states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
-        
-        states = torch.FloatTensor(states).to(self.device)
-        actions = torch.LongTensor(actions).unsqueeze(1).to(self.device) 
-        rewards = torch.FloatTensor(rewards).to(self.device)
-        next_states = torch.FloatTensor(next_states).to(self.device)
-        dones = torch.FloatTensor(dones).to(self.device)
-        
-        # Calcular os Q(s, a) atuais
-        state_action_values = self.policy_net(states).gather(1, actions).squeeze(1)
-        
-        # Calcular os max Q(s', a') usando a rede alvo
+        # Calcular os max Q(s', a') usando a rede alvo, só sobre as jogadas legais em s'
         with torch.no_grad():
-            next_state_values = self.target_net(next_states).max(1)[0]
+            if next_masks is not None:
+                next_q_values = next_q_values.masked_fill(~next_masks, -float('inf'))
+            next_state_values = next_q_values.max(1)[0]
+            # Estados terminais não têm jogadas legais (o max daria -inf)
+            next_state_values = next_state_values.masked_fill(dones.bool(), 0.0)
             
         # Q-values esperados
         expected_state_action_values = rewards + (self.gamma * next_state_values * (1 - dones))
         
-        # Função de perda (Huber Loss)
-        criterion = nn.SmoothL1Loss()
-        loss = criterion(state_action_values, expected_state_action_values)
+        # Função de perda (Huber Loss), pesada por importance sampling com prioridades
+        criterion = nn.SmoothL1Loss(reduction='none')
+        losses = criterion(state_action_values, expected_state_action_values)
+        loss = (losses * weights).mean() if weights is not None else losses.mean()
+        return loss, (state_action_values - expected_state_action_values).detach()
         
-        # Otimizar (Backpropagation)
-        self.optimizer.zero_grad()
-        loss.backward()
+    def optimize_model(self, gradient_steps=1):
+        """
+        Faz `gradient_steps` passos de gradiente seguidos e devolve a perda média.
+        O buffer já devolve tensores no dispositivo certo.
+        """
+        if len(self.memory) < self.batch_size:
+            return 0.0
+
+        total_loss = 0.0
+        for _ in range(gradient_steps):
+            self.optimizer.zero_grad(set_to_none=True)
+            for _ in range(self.grad_accum_steps):
+                with profiler.span("learner.sample"):
+                    batch = self.memory.sample(self.batch_size)
+                with profiler.span("learner.forward"):
+                    loss, td_errors = self._compute_loss(batch)
+                    loss = loss / self.grad_accum_steps
+                if batch.indices is not None:
+                    with profiler.span("learner.priorities"):
+                        self.memory.update_priorities(batch.indices, td_errors.cpu().numpy())
+                # Otimizar (Backpropagation), acumulando os gradientes dos mini-lotes
+                with profiler.span("learner.backward"):
+                    if self.scaler is not None:
+                        self.scaler.scale(loss).backward()
+                    else:
+                        loss.backward()
+                total_loss += loss.detach()
         
-        # Clipping para limitar a "explosão" dos gradientes na aprendizagem
-        for param in self.policy_net.parameters():
-            if param.grad is not None:
-                param.grad.data.clamp_(-1, 1)
-                
-        self.optimizer.step()
+            with profiler.span("learner.optimizer"):
+                # Clipping para limitar a "explosão" dos gradientes na aprendizagem
+                # (sobre os gradientes reais, por isso primeiro desfaz-se a escala do fp16)
+                if self.scaler is not None:
+                    self.scaler.unscale_(self.optimizer)
+                nn.utils.clip_grad_value_(self.policy_net.parameters(), 1)
+                    
+                if self.scaler is not None:
+                    self.scaler.step(self.optimizer)
+                    self.scaler.update()
+                else:
+                    self.optimizer.step()
+            self.updates += 1
+
+            with profiler.span("learner.target_sync"):
+                if self.target_tau is not None:
+                    self.soft_update_target_network(self.target_tau)
+                elif self.target_update_steps is not None and self.updates % self.target_update_steps == 0:
+                    self.update_target_network()
         
-        return loss.item()
+        return (total_loss / gradient_steps).item()
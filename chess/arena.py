@@ -0,0 +1,204 @@
+import argparse
+import json
+import math
+import os
+import random
+import time
+from collections import defaultdict, deque
+
+import chess
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from agent import masked_argmax
+from env import ChessEnv, NUM_ACTIONS, NUM_PROMOTION_ACTIONS
+from model import load_net
+
+# Jogador que escolhe uma jogada legal ao acaso (o oponente do train.py)
+RANDOM = "random"
+
+def load_player(spec):
+    """Rede de um checkpoint (com a cabeça que lá estiver), ou None para o jogador aleatório"""
+    if spec == RANDOM:
+        return None
+    return load_net(spec)
+
+def player_name(spec):
+    return spec if spec == RANDOM else os.path.basename(spec)
+
+def schedule(num_players, games):
+    """
+    Todos contra todos: `games` jogos por par de jogadores, com as cores
+    alternadas. Devolve [(id do jogo, brancas, pretas)].
+    """
+    jobs = []
+    for a in range(num_players):
+        for b in range(a + 1, num_players):
+            for g in range(games):
+                white, black = (a, b) if g % 2 == 0 else (b, a)
+                jobs.append((len(jobs), white, black))
+    return jobs
+
+class _Game:
+    __slots__ = ("game_id", "white", "black", "env", "state", "rng", "plies")
+
+    def __init__(self, game_id, white, black, seed):
+        self.game_id = game_id
+        self.white = white
+        self.black = black
+        # Codificação com promoções: as 4096 primeiras ações são as da cabeça
+        # densa, por isso as duas cabeças podem jogar no mesmo ambiente
+        self.env = ChessEnv(promotions=True)
+        self.state, _ = self.env.reset()
+        # Semente por jogo: o resultado não depende do processo nem da ordem em que o jogo corre
+        self.rng = random.Random(seed * 1_000_003 + game_id)
+        self.plies = 0
+
+    def to_move(self):
+        return self.white if self.env.board.turn == chess.WHITE else self.black
+
+def play_games(specs, jobs, seed=0, concurrency=32, opening_plies=4, max_plies=300):
+    """
+    Joga os jogos `jobs` num só processo, até `concurrency` de cada vez em
+    lockstep: em cada meia-jogada, os tabuleiros de todos os jogos em que é a
+    vez da mesma rede são avaliados numa só forward pass. As redes jogam a
+    melhor jogada (sem exploração); as primeiras `opening_plies` meias-jogadas
+    são aleatórias, para os jogos entre as mesmas redes não serem todos iguais.
+    Devolve [(id do jogo, brancas, pretas, pontos das brancas)].
+    """
+    torch.set_num_threads(1)
+    players = {p for _, white, black in jobs for p in (white, black)}
+    nets = {p: load_player(specs[p]) for p in players}
+
+    pending = deque(jobs)
+    active = []
+    results = []
+    while pending or active:
+        while pending and len(active) < concurrency:
+            active.append(_Game(*pending.popleft(), seed))
+
+        actions = {}
+        by_player = defaultdict(list)
+        for game in active:
+            player = game.to_move()
+            if game.plies < opening_plies or nets[player] is None:
+                actions[game] = game.rng.choice(list(game.env.get_legal_actions()))
+            else:
+                by_player[player].append(game)
+        for player, games in by_player.items():
+            num_actions = NUM_PROMOTION_ACTIONS if nets[player].head == "compact" else NUM_ACTIONS
+            states = np.stack([g.state for g in games])
+            masks = np.stack([g.env.get_legal_mask()[:num_actions] for g in games])
+            for game, action in zip(games, masked_argmax(nets[player], states, masks)):
+                actions[game] = int(action)
+
+        still_active = []
+        for game in active:
+            mover = game.env.board.turn
+            game.state, _, done, _ = game.env.step(actions[game])
+            game.plies += 1
+            if done or game.plies >= max_plies:
+                # Xeque-mate ganha quem acabou de jogar; o resto (e o limite de jogadas) é empate
+                if done and game.env.board.is_checkmate():
+                    white_score = 1.0 if mover == chess.WHITE else 0.0
+                else:
+                    white_score = 0.5
+                results.append((game.game_id, game.white, game.black, white_score))
+            else:
+                still_active.append(game)
+        active = still_active
+    return results
+
+def elo_estimate(wins, draws, losses, z=1.96):
+    """
+    Diferença de Elo implícita na pontuação, com o intervalo de Wilson da
+    pontuação (z=1.96 para 95%). A variância binomial do Wilson nunca é menor
+    do que a real, por isso só com empates o intervalo não tem largura zero.
+    A pontuação e os limites ficam a meio jogo dos extremos (entre 0.5/n e
+    1 - 0.5/n), para o Elo ser sempre finito. Devolve (elo, limite inferior,
+    limite superior, limitado), com limitado=True se algum valor foi cortado.
+    """
+    n = wins + draws + losses
+    score = (wins + 0.5 * draws) / n
+    denominator = 1 + z * z / n
+    center = (score + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(score * (1 - score) / n + z * z / (4 * n * n)) / denominator
+    values = (score, center - margin, center + margin)
+    clipped = [min(max(s, 0.5 / n), 1 - 0.5 / n) for s in values]
+
+    def to_elo(s):
+        return -400 * math.log10(1 / s - 1) + 0.0 # Sem "-0"
+
+    elo, low, high = (to_elo(s) for s in clipped)
+    return elo, low, high, any(c != s for c, s in zip(clipped, values))
+
+def summarize(specs, results):
+    """Vitórias/empates/derrotas e Elo de cada par (do ponto de vista do primeiro jogador do par)"""
+    tallies = defaultdict(lambda: [0, 0, 0])
+    for _, white, black, white_score in results:
+        a, b = min(white, black), max(white, black)
+        score_a = white_score if white == a else 1 - white_score
+        tallies[(a, b)][0 if score_a == 1 else 1 if score_a == 0.5 else 2] += 1
+    pairs = []
+    for (a, b), (wins, draws, losses) in sorted(tallies.items()):
+        elo, low, high, clamped = elo_estimate(wins, draws, losses)
+        pairs.append({"player": player_name(specs[a]), "opponent": player_name(specs[b]),
+                      "wins": wins, "draws": draws, "losses": losses,
+                      "score": (wins + 0.5 * draws) / (wins + draws + losses),
+                      "elo": elo, "elo_low": low, "elo_high": high, "elo_clamped": clamped})
+    return pairs
+
+def run_arena(specs, games=100, workers=None, concurrency=32, seed=0, opening_plies=4, max_plies=300, out=None):
+    """
+    Avalia os jogadores `specs` (checkpoints ou "random") todos contra todos,
+    em `workers` processos. Os jogos são distribuídos pelos processos de forma
+    fixa, por isso com as mesmas opções e a mesma semente o resultado repete-se.
+    """
+    workers = workers or os.cpu_count()
+    jobs = schedule(len(specs), games)
+    start = time.perf_counter()
+    if workers == 1:
+        results = play_games(specs, jobs, seed, concurrency, opening_plies, max_plies)
+    else:
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(workers) as pool:
+            parts = [pool.apply_async(play_games, (specs, jobs[w::workers], seed, concurrency,
+                                                   opening_plies, max_plies))
+                     for w in range(workers)]
+            results = [r for part in parts for r in part.get()]
+    seconds = time.perf_counter() - start
+
+    pairs = summarize(specs, sorted(results))
+    for p in pairs:
+        print(f"{p['player']} vs {p['opponent']}: +{p['wins']} ={p['draws']} -{p['losses']} "
+              f"(pontuação {p['score']:.3f})  Elo {p['elo']:+.0f} [{p['elo_low']:+.0f}, {p['elo_high']:+.0f}]"
+              + (" (limitado: pontuação no extremo)" if p['elo_clamped'] else ""))
+    print(f"{len(results)} jogos em {seconds:.1f} s ({len(results) / seconds:.2f} jogos/s, {workers} processos)")
+
+    report = {"players": specs, "games_per_pair": games, "seed": seed, "workers": workers,
+              "concurrency": concurrency, "opening_plies": opening_plies, "max_plies": max_plies,
+              "seconds": seconds, "games_per_s": len(results) / seconds, "pairs": pairs}
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2, allow_nan=False)
+        print(f"Resultados gravados em '{out}'.")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arena de avaliação: checkpoints uns contra os outros")
+    parser.add_argument("players", nargs="+",
+                        help=f"Checkpoints .pth (ou '{RANDOM}' para o oponente aleatório do treino)")
+    parser.add_argument("--games", type=int, default=100, help="Jogos por par de jogadores")
+    parser.add_argument("--workers", type=int, default=None, help="Processos (por omissão, um por CPU)")
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="Jogos simultâneos por processo (tamanho máximo do lote da rede)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--opening-plies", type=int, default=4, help="Meias-jogadas iniciais aleatórias")
+    parser.add_argument("--max-plies", type=int, default=300, help="Limite de meias-jogadas (empate)")
+    parser.add_argument("--out", default=None, help="Ficheiro JSON com os resultados")
+    args = parser.parse_args()
+    if len(args.players) < 2:
+        parser.error("são precisos pelo menos dois jogadores")
+    run_arena(args.players, args.games, args.workers, args.concurrency, args.seed,
+              args.opening_plies, args.max_plies, args.out)
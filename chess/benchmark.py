@@ -0,0 +1,800 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import time
+from collections import Counter, deque
+
+import chess
+import numpy as np
+import torch
+
+from env import ChessEnv, VectorChessEnv, encode_boards
+from agent import DQNAgent
+from model import ChessDQN
+from replay import ReplayBuffer, CompactReplayBuffer, SumTree
+
+class DequeReplayBuffer:
+    """Versão original (deque de tuplos), mantida apenas para comparação."""
+    def __init__(self, capacity):
+        self.buffer = deque(maxlen=capacity)
+
+    def push(self, state, action, reward, next_state, done):
+        self.buffer.append((state, action, reward, next_state, done))
+
+    def sample(self, batch_size):
+        batch = random.sample(self.buffer, batch_size)
+        state, action, reward, next_state, done = zip(*batch)
+        states = torch.FloatTensor(np.array(state))
+        actions = torch.LongTensor(action)
+        rewards = torch.FloatTensor(reward)
+        next_states = torch.FloatTensor(np.array(next_state))
+        dones = torch.FloatTensor(done)
+        return states, actions, rewards, next_states, dones
+
+    def __len__(self):
+        return len(self.buffer)
+
+def legacy_get_state(board):
+    """Codificador original de ChessEnv.get_state (casa a casa), para comparação."""
+    state = np.zeros((12, 8, 8), dtype=np.float32)
+    turn = board.turn
+    for piece_type in range(1, 7):
+        for color in [chess.WHITE, chess.BLACK]:
+            channel = (piece_type - 1) + (0 if color == turn else 6)
+            for sq in board.pieces(piece_type, color):
+                rank = chess.square_rank(sq)
+                file = chess.square_file(sq)
+                if turn == chess.BLACK:
+                    rank = 7 - rank
+                    file = 7 - file
+                state[channel, rank, file] = 1.0
+    return state
+
+class LegacyChessEnv(ChessEnv):
+    """ChessEnv com o step original (listas de jogadas regeneradas e material recontado)."""
+    def get_legal_actions(self):
+        actions = []
+        turn = self.board.turn
+        for move in self.board.legal_moves:
+            from_sq = move.from_square
+            to_sq = move.to_square
+            if turn == chess.BLACK:
+                from_sq = from_sq ^ 63
+                to_sq = to_sq ^ 63
+            actions.append((from_sq * 64 + to_sq, move))
+        return actions
+
+    def step(self, action_idx):
+        legal_actions = self.get_legal_actions()
+        move = None
+        for idx, m in legal_actions:
+            if idx == action_idx:
+                move = m
+                break
+        if move is None:
+            return self.get_state(), -10, True, {"error": "Invalid action", "legal_actions": self.get_legal_actions()}
+        current_turn = self.board.turn
+        adv_before = self._get_material_score(current_turn) - self._get_material_score(not current_turn)
+        self.board.push(move)
+        adv_after = self._get_material_score(current_turn) - self._get_material_score(not current_turn)
+        reward = adv_after - adv_before
+        done = self.board.is_game_over()
+        if done:
+            result = self.board.result()
+            if result == "1-0":
+                reward += 100 if current_turn == chess.WHITE else -100
+            elif result == "0-1":
+                reward += 100 if current_turn == chess.BLACK else -100
+        info = {"legal_actions": self.get_legal_actions() if not done else []}
+        return self.get_state(), reward, done, info
+
+def _random_games(n_games, seed=0):
+    """Sequências fixas de índices de ação de jogos aleatórios completos"""
+    rng = random.Random(seed)
+    env = ChessEnv()
+    games = []
+    for _ in range(n_games):
+        _, legal_actions = env.reset()
+        actions = []
+        done = False
+        while not done:
+            action = rng.choice(sorted(legal_actions))
+            _, _, done, info = env.step(action)
+            legal_actions = info["legal_actions"]
+            actions.append(action)
+        games.append(actions)
+    return games
+
+def _random_positions(n, seed=0):
+    """Conjunto determinístico de posições, tiradas de jogos aleatórios"""
+    rng = random.Random(seed)
+    board = chess.Board()
+    positions = []
+    while len(positions) < n:
+        if board.is_game_over():
+            board.reset()
+        positions.append(board.copy(stack=False))
+        board.push(rng.choice(list(board.legal_moves)))
+    return positions
+
+def _random_states(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.random((n, 12, 8, 8)) < 0.05).astype(np.float32)
+
+def _timeit(fn, repeat):
+    fn() # Aquecimento
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def bench_replay(capacities=(10_000, 1_000_000), batch_size=64, repeat=200):
+    """Compara push/sample do buffer original (deque) com o buffer em arrays."""
+    # Um conjunto pequeno de estados reutilizados, para o deque não esgotar a RAM
+    pool = _random_states(256)
+    results = []
+    for capacity in capacities:
+        for name, cls in (("deque", DequeReplayBuffer), ("array", ReplayBuffer)):
+            buf = cls(capacity)
+            start = time.perf_counter()
+            for i in range(capacity):
+                buf.push(pool[i % 256], i % 4096, 1.0, pool[(i + 1) % 256], i % 100 == 0)
+            push_us = (time.perf_counter() - start) / capacity * 1e6
+            sample_ms = _timeit(lambda: buf.sample(batch_size), repeat) * 1e3
+            results.append((capacity, name, push_us, sample_ms))
+            print(f"capacidade={capacity:>9} {name:>6}: push={push_us:6.2f} us  "
+                  f"sample({batch_size})={sample_ms:7.3f} ms")
+            buf = None # Libertar o buffer antes de criar o seguinte
+    return results
+
+def _random_game_transitions(n, seed=0, promotions=False, masks=False):
+    """
+    Transições reais (state, action, reward, next_state, done) de jogos
+    aleatórios, com a máscara das jogadas legais em next_state se masks=True
+    """
+    rng = random.Random(seed)
+    env = ChessEnv(promotions)
+    state, legal_actions = env.reset()
+    transitions = []
+    while len(transitions) < n:
+        action = rng.choice(list(legal_actions))
+        next_state, reward, done, info = env.step(action)
+        transitions.append((state, action, reward, next_state, done) + ((info["legal_mask"],) if masks else ()))
+        if done:
+            state, legal_actions = env.reset()
+        else:
+            state, legal_actions = next_state, info["legal_actions"]
+    return transitions
+
+def _deque_nbytes(buf):
+    # Arrays float32 mais o tuplo de cada transição. Cada array conta uma só
+    # vez: o next_state de uma transição é o state da seguinte (o mesmo objeto)
+    arrays = {}
+    for state, _, _, next_state, _ in buf.buffer:
+        arrays[id(state)] = state
+        arrays[id(next_state)] = next_state
+    return sum(a.nbytes + 112 for a in arrays.values()) + 80 * len(buf)
+
+def bench_compact(n=20_000, batch_size=64, repeat=200):
+    """Memória por transição e custo de amostragem com transições de jogos reais."""
+    transitions = _random_game_transitions(n)
+    results = []
+    for name, buf in (("deque", DequeReplayBuffer(n)), ("array", ReplayBuffer(n)), ("compact", CompactReplayBuffer(n))):
+        start = time.perf_counter()
+        for t in transitions:
+            buf.push(*t)
+        push_us = (time.perf_counter() - start) / n * 1e6
+        nbytes = _deque_nbytes(buf) if name == "deque" else buf.nbytes
+        sample_ms = _timeit(lambda: buf.sample(batch_size), repeat) * 1e3
+        results.append((name, nbytes / n, push_us, sample_ms))
+        print(f"{name:>8}: {nbytes / n:8.1f} bytes/transição  push={push_us:6.2f} us  "
+              f"sample({batch_size})={sample_ms:7.3f} ms")
+    print(f"Redução de memória (deque -> compact): {results[0][1] / results[2][1]:.1f}x")
+    return results
+
+def check_state_encoders(positions, batch_size=256):
+    """
+    Confirma que get_state e encode_boards dão exatamente os mesmos bytes
+    (valores, dtype e forma) que o codificador original em todas as posições.
+    Lança AssertionError com a primeira posição diferente.
+    """
+    env = ChessEnv()
+    for i in range(0, len(positions), batch_size):
+        chunk = positions[i:i + batch_size]
+        batch = encode_boards(chunk)
+        for j, board in enumerate(chunk):
+            expected = legacy_get_state(board)
+            env.board = board.copy()
+            for name, state in (("get_state", env.get_state()), ("encode_boards", batch[j])):
+                if state.dtype != expected.dtype or state.shape != expected.shape \
+                        or state.tobytes() != expected.tobytes():
+                    raise AssertionError(f"{name} difere do codificador original na posição "
+                                         f"{i + j}: {board.fen()}")
+
+def bench_state(n=5_000, batch_size=256):
+    """
+    Posições por segundo do codificador original, do novo e da versão em lote,
+    depois de confirmar que os três dão o mesmo estado em todas as posições.
+    """
+    positions = _random_positions(n)
+    check_state_encoders(positions, batch_size)
+    print(f"Codificadores idênticos ao original em {n} posições.")
+    env = ChessEnv()
+    # Cópias para o ambiente: um reset ou step nunca altera as posições de teste
+    boards = [board.copy() for board in positions]
+
+    def new_encoder():
+        for board in boards:
+            # get_state só lê o tabuleiro, não é preciso passar por set_board
+            env.board = board
+            env.get_state()
+
+    def batch_encoder():
+        for i in range(0, n, batch_size):
+            encode_boards(positions[i:i + batch_size])
+
+    results = {}
+    for name, fn in (("original", lambda: [legacy_get_state(b) for b in positions]),
+                     ("bitboards", new_encoder), ("lote", batch_encoder)):
+        seconds = _timeit(fn, 3)
+        results[name] = n / seconds
+        print(f"{name:>10}: {n / seconds:10.0f} posições/s")
+    return results
+
+def bench_step(n_games=20):
+    """Passos por segundo de ChessEnv.step, num conjunto fixo de jogos aleatórios."""
+    games = _random_games(n_games)
+    n_steps = sum(len(g) for g in games)
+    results = {}
+    for name, env in (("original", LegacyChessEnv()), ("cache", ChessEnv())):
+        def play_all():
+            for actions in games:
+                env.reset()
+                for action in actions:
+                    _, _, _, info = env.step(action)
+                    # Como o train.py, quem chama lê as jogadas legais devolvidas
+                    len(info["legal_actions"])
+        seconds = _timeit(play_all, 2)
+        results[name] = n_steps / seconds
+        print(f"{name:>10}: {n_steps / seconds:8.0f} passos/s ({n_steps} passos, {n_games} jogos)")
+    return results
+
+def _legacy_select_action(agent, state, legal_actions):
+    """Escolha greedy original: um .item() (sincronização) por cada jogada legal"""
+    with torch.no_grad():
+        q_values = agent.policy_net(torch.FloatTensor(state).unsqueeze(0).to(agent.device)).squeeze(0)
+        best_action, best_q = None, -float('inf')
+        for action_idx in legal_actions:
+            q = q_values[action_idx].item()
+            if q > best_q:
+                best_q, best_action = q, action_idx
+        return best_action
+
+def bench_select(n=300, device="cpu"):
+    """Latência de select_action (epsilon=0): ciclo por jogada vs argmax com máscara."""
+    torch.manual_seed(0)
+    agent = DQNAgent(device=device)
+    env = ChessEnv()
+    samples = []
+    for board in _random_positions(n):
+        env.set_board(board)
+        if env.get_legal_actions():
+            samples.append((env.get_state(), env.get_legal_actions(), env.get_legal_mask()))
+
+    results = {}
+    for name, fn in (("ciclo", lambda s, l, m: _legacy_select_action(agent, s, l)),
+                     ("máscara", lambda s, l, m: agent.select_action(s, l, 0.0, m))):
+        seconds = _timeit(lambda: [fn(*sample) for sample in samples], 3)
+        results[name] = seconds / len(samples) * 1e3
+        print(f"{name:>8}: {results[name]:.3f} ms por jogada ({device})")
+    return results
+
+def bench_vector(sizes=(1, 2, 4, 8, 16, 32), steps=40, device="cpu"):
+    """Passos de ambiente por segundo do VectorChessEnv com seleção greedy em lote."""
+    torch.manual_seed(0)
+    np.random.seed(0)
+    agent = DQNAgent(device=device)
+    results = {}
+    for n in sizes:
+        envs = VectorChessEnv(n, seed=0)
+        states, masks = envs.reset()
+        start = time.perf_counter()
+        for _ in range(steps):
+            actions = agent.select_actions(states, masks, 0.0)
+            envs.step(actions)
+            states, masks = envs.states, envs.masks
+        seconds = time.perf_counter() - start
+        results[n] = n * steps / seconds
+        print(f"num_envs={n:>3}: {results[n]:8.1f} passos/s ({results[n] / results[sizes[0]]:.1f}x)")
+    return results
+
+def bench_actors(counts=(1, 2, 4), seconds=20.0, envs_per_actor=1):
+    """Transições/s e jogos/s gerados só pelos atores (sem learner), para dimensionar K."""
+    import queue
+    import torch.multiprocessing as mp
+    from actors import SharedWeights, actor_loop
+
+    ctx = mp.get_context("spawn")
+    weights = SharedWeights(ChessDQN(), ctx)
+    results = {}
+    for k in counts:
+        transitions = ctx.Queue(maxsize=16 * k)
+        stop = ctx.Event()
+        actors = [ctx.Process(target=actor_loop, daemon=True,
+                              args=(i, k, weights, transitions, stop, envs_per_actor, 64, 20, i))
+                  for i in range(k)]
+        for p in actors:
+            p.start()
+        # Só conta depois de o primeiro bloco chegar (arranque dos processos)
+        transitions.get()
+        n_transitions, n_games = 0, 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            try:
+                _, games, block = transitions.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            n_transitions += len(block[1])
+            n_games += games
+        elapsed = time.perf_counter() - start
+        stop.set()
+        while any(p.is_alive() for p in actors):
+            try:
+                transitions.get(timeout=0.1)
+            except (queue.Empty, OSError):
+                pass
+        results[k] = (n_transitions / elapsed, n_games / elapsed)
+        print(f"atores={k:>2}: {results[k][0]:8.1f} transições/s  {results[k][1]:6.2f} jogos/s")
+    return results
+
+def bench_inference(threads=16, moves=20, max_batch=64, max_wait_ms=2.0):
+    """
+    N threads a pedir jogadas ao mesmo tempo: forward individual por pedido
+    vs InferenceServer. Mostra jogadas/s, histograma dos lotes e p50/p99.
+    """
+    import threading
+    from inference import InferenceServer
+
+    torch.manual_seed(0)
+    net = ChessDQN().eval()
+    lock = threading.Lock()
+    samples = []
+    env = ChessEnv()
+    for board in _random_positions(threads * moves):
+        env.set_board(board)
+        if env.get_legal_actions():
+            samples.append((env.get_state(), env.get_legal_mask()))
+
+    def run(select):
+        def worker(k):
+            for state, mask in samples[k::threads]:
+                select(state, mask)
+        workers = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        return len(samples) / (time.perf_counter() - start)
+
+    def direct(state, mask):
+        # Sem servidor: cada thread faz a sua forward pass (serializadas pelo lock)
+        with lock, torch.no_grad():
+            q = net(torch.from_numpy(state)[None])[0]
+            return q.masked_fill(~torch.from_numpy(mask), -float('inf')).argmax().item()
+
+    rate_direct = run(direct)
+    print(f"   direto: {rate_direct:8.1f} jogadas/s")
+    with InferenceServer(net, max_batch=max_batch, max_wait_ms=max_wait_ms) as server:
+        rate_server = run(lambda state, mask: server.submit(state[None], mask[None]).result())
+    stats = server.stats()
+    print(f" servidor: {rate_server:8.1f} jogadas/s  p50={stats['p50_ms']:.2f} ms  p99={stats['p99_ms']:.2f} ms")
+    print(f"   lotes: {stats['batch_sizes']}")
+    return {"direct": rate_direct, "server": rate_server, **stats}
+
+SCHEDULES = {
+    "original (treino a cada passo)": {},
+    "train_every=4": {"train_every": 4},
+    "train_every=4, 2 passos": {"train_every": 4, "gradient_steps": 2},
+    "train_every=8, lote 256 (4x64)": {"train_every": 8, "grad_accum_steps": 4},
+    "polyak tau=0.005": {"target_tau": 0.005},
+    "alvo a cada 500 passos": {"target_update_steps": 500},
+}
+
+def bench_schedule(env_steps=300, num_envs=4):
+    """Tempo de relógio por 1000 passos de ambiente para cada calendário de treino."""
+    import contextlib
+    import io
+    from train import train_agent
+
+    results = {}
+    for name, kwargs in SCHEDULES.items():
+        torch.manual_seed(0)
+        np.random.seed(0)
+        # Os prints do train_agent não interessam aqui
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent = train_agent(episodes=10**9, num_envs=num_envs, max_env_steps=env_steps,
+                                save_path=None, **kwargs)
+        ms_per_1k = agent.train_seconds / agent.env_steps * 1e6
+        results[name] = ms_per_1k
+        print(f"{name:>32}: {ms_per_1k:9.0f} ms/1k passos ({agent.updates} atualizações)")
+    return results
+
+AMP_CONFIGS = {
+    "fp32": {},
+    "bf16": {"amp_dtype": "bfloat16"},
+    "channels_last": {"channels_last": True},
+    "bf16 + channels_last": {"amp_dtype": "bfloat16", "channels_last": True},
+}
+
+def bench_amp(steps=20, batch_size=128, compile_model=False, device="cpu"):
+    """
+    Amostras/s do optimize_model em cada configuração do caminho rápido e
+    paridade da perda com fp32 (mesmos pesos iniciais e mesmos lotes).
+    """
+    configs = dict(AMP_CONFIGS)
+    if compile_model:
+        configs["bf16 + channels_last + compile"] = {"amp_dtype": "bfloat16", "channels_last": True,
+                                                     "compile_model": True}
+    memory = ReplayBuffer(5000, device=device)
+    for t in _random_game_transitions(5000):
+        memory.push(*t)
+
+    results = {}
+    baseline = None
+    for name, kwargs in configs.items():
+        torch.manual_seed(0)
+        agent = DQNAgent(device=device, batch_size=batch_size, **kwargs)
+        agent.memory = memory
+        np.random.seed(1)
+        agent.optimize_model() # Aquecimento (e compilação)
+        np.random.seed(0)
+        # Recomeçar dos mesmos pesos para comparar as perdas passo a passo
+        torch.manual_seed(0)
+        agent.policy_net.load_state_dict(ChessDQN().state_dict())
+        agent.target_net.load_state_dict(agent.policy_net.state_dict())
+        agent.optimizer = torch.optim.Adam(agent.policy_net.parameters(), lr=1e-4)
+        losses = []
+        start = time.perf_counter()
+        for _ in range(steps):
+            losses.append(agent.optimize_model())
+        seconds = time.perf_counter() - start
+        losses = np.array(losses)
+        if baseline is None:
+            baseline = losses
+        rel = float(np.mean(np.abs(losses - baseline) / np.maximum(np.abs(baseline), 1e-8)))
+        results[name] = {"samples_per_s": steps * batch_size / seconds, "loss_rel_diff": rel}
+        print(f"{name:>32}: {steps * batch_size / seconds:8.1f} amostras/s  "
+              f"diferença relativa da perda vs fp32={rel:.2e}")
+    return results
+
+def bench_head(batch_size=64, steps=30, repeat=20, device="cpu"):
+    """
+    Cabeça densa (ChessDQN) vs compacta (LegalMoveDQN): parâmetros, latência
+    da forward pass e da forward + backward da perda, e amostras/s do
+    optimize_model sobre a mesma memória de jogos aleatórios.
+    """
+    results = {}
+    for head in ("dense", "compact"):
+        torch.manual_seed(0)
+        np.random.seed(0)
+        agent = DQNAgent(device=device, batch_size=batch_size, memory_size=5000, head=head)
+        for t in _random_game_transitions(5000, promotions=agent.promotions, masks=True):
+            agent.store_transition(*t)
+        batch = agent.memory.sample(batch_size)
+        net = agent.policy_net
+
+        def forward():
+            with torch.no_grad():
+                net(batch.states)
+
+        def forward_backward():
+            loss, _ = agent._compute_loss(batch)
+            loss.backward()
+            agent.optimizer.zero_grad(set_to_none=True)
+
+        forward_ms = _timeit(forward, repeat) * 1e3
+        backward_ms = _timeit(forward_backward, repeat) * 1e3
+        agent.optimize_model() # Aquecimento
+        start = time.perf_counter()
+        agent.optimize_model(steps)
+        samples_per_s = steps * batch_size / (time.perf_counter() - start)
+        params = sum(p.numel() for p in net.parameters())
+        results[head] = {"params": params, "forward_ms": forward_ms, "forward_backward_ms": backward_ms,
+                         "samples_per_s": samples_per_s}
+        print(f"{head:>8}: {params:>10,} parâmetros  forward={forward_ms:7.2f} ms  "
+              f"forward+backward={backward_ms:7.2f} ms  treino={samples_per_s:8.1f} amostras/s "
+              f"(lote {batch_size}, {agent.num_actions} ações)")
+    return results
+
+def bench_cache(games=10, max_moves=40, cache_size=50_000):
+    """
+    Jogos de avaliação (agente greedy vs oponente aleatório com semente) com e
+    sem a cache de posições: tempo, taxa de acertos e jogadas idênticas.
+    """
+    results = {}
+    chosen = {}
+    for name, size in (("sem cache", 0), ("com cache", cache_size)):
+        torch.manual_seed(0)
+        agent = DQNAgent(cache_size=size)
+        rng = random.Random(0)
+        env = ChessEnv()
+        moves = []
+        start = time.perf_counter()
+        for _ in range(games):
+            state, legal_actions = env.reset()
+            for _ in range(max_moves):
+                action = agent.select_action(state, legal_actions, 0.0, env.get_legal_mask(), env.position_key())
+                moves.append(action)
+                state, _, done, info = env.step(action)
+                if done:
+                    break
+                # Oponente com poucas escolhas, para haver transposições entre jogos
+                opp_action = sorted(info["legal_actions"])[rng.randrange(min(3, len(info["legal_actions"])))]
+                state, _, done, info = env.step(opp_action)
+                legal_actions = info["legal_actions"]
+                if done:
+                    break
+        seconds = time.perf_counter() - start
+        chosen[name] = moves
+        stats = agent.cache.stats() if agent.cache else {}
+        results[name] = {"seconds": seconds, **stats}
+        print(f"{name:>10}: {seconds:6.2f} s  {len(moves) / seconds:7.1f} jogadas/s  {stats}")
+    print("Mesmas jogadas com e sem cache:", chosen["sem cache"] == chosen["com cache"])
+    return results
+
+def bench_search(batch_sizes=(1, 4, 16, 32), nodes=400, positions=5):
+    """
+    MCTS com orçamento fixo de nós em posições de jogos aleatórios: nós/s e
+    tamanhos de lote de avaliação das folhas para cada batch_size.
+    """
+    from search import MCTS
+    torch.manual_seed(0)
+    net = ChessDQN().eval()
+    boards = _random_positions(positions)
+    results = {}
+    for batch_size in batch_sizes:
+        total_nodes, seconds, batches = 0, 0.0, Counter()
+        for board in boards:
+            search = MCTS(net, batch_size=batch_size)
+            search.search(board, max_nodes=nodes)
+            total_nodes += search.nodes
+            seconds += search.seconds
+            batches.update(search.batch_sizes)
+        forwards = sum(batches.values())
+        mean_batch = sum(size * count for size, count in batches.items()) / max(forwards, 1)
+        results[batch_size] = {"nodes_per_s": total_nodes / seconds, "forwards": forwards, "mean_batch": mean_batch}
+        print(f"batch_size={batch_size:>3}: {total_nodes / seconds:8.1f} nós/s  "
+              f"{forwards:5d} forward passes  lote médio={mean_batch:.1f}")
+    return results
+
+def bench_per(capacities=(10_000, 100_000, 1_000_000), batch_size=64, repeat=500):
+    """
+    Custo de amostrar um lote e de atualizar as suas prioridades na SumTree,
+    com o buffer cheio, para capacidades crescentes (deve ficar quase plano).
+    """
+    results = {}
+    rng = np.random.default_rng(0)
+    for capacity in capacities:
+        tree = SumTree(capacity)
+        tree.update(np.arange(capacity), rng.random(capacity) + 1e-3)
+        total = tree.total
+
+        def sample():
+            values = (np.arange(batch_size) + rng.random(batch_size)) * (total / batch_size)
+            return tree.find(values)
+
+        idx = sample()
+        priorities = rng.random(batch_size) + 1e-3
+        sample_us = _timeit(sample, repeat) * 1e6
+        update_us = _timeit(lambda: tree.update(idx, priorities), repeat) * 1e6
+        uniform_us = _timeit(lambda: rng.integers(0, capacity, size=batch_size), repeat) * 1e6
+        results[capacity] = {"sample_us": sample_us, "update_us": update_us, "uniform_us": uniform_us}
+        print(f"capacidade={capacity:>9,}: amostrar={sample_us:6.1f} µs  atualizar={update_us:6.1f} µs  "
+              f"(uniforme={uniform_us:5.1f} µs)  profundidade={tree.depth}")
+    return results
+
+def _suite_cases():
+    """
+    Casos do conjunto de regressão: (nome, função a medir, operações por
+    chamada). Tudo em CPU, com sementes fixas e posições determinísticas.
+    """
+    random.seed(0)
+    np.random.seed(0)
+    torch.manual_seed(0)
+    positions = _random_positions(1_000)
+    games = _random_games(5)
+    # Os casos só de leitura usam cópias das posições (copiadas aqui, fora da
+    # medição) e o step tem o seu próprio ambiente: um reset ou step nunca
+    # altera as posições usadas pelos outros casos e repetições
+    boards = [board.copy() for board in positions]
+    env = ChessEnv()
+    step_env = ChessEnv()
+
+    def get_state():
+        for board in boards:
+            env.board = board
+            env.get_state()
+
+    def get_legal_actions():
+        for board in boards:
+            # Sem passar pela cache: gerar as jogadas de cada posição
+            env.board = board
+            env._legal_actions = None
+            env.get_legal_actions()
+
+    def step():
+        for actions in games:
+            step_env.reset()
+            for action in actions:
+                step_env.step(action)
+
+    rng = np.random.default_rng(0)
+    states = (rng.random((256, 12, 8, 8)) < 0.05).astype(np.float32)
+    masks = rng.random((256, 4096)) < 0.01
+    buffer = ReplayBuffer(10_000)
+
+    def push():
+        for i in range(len(states)):
+            buffer.push(states[i], i, 0.0, states[-i], False, masks[i])
+
+    for _ in range(40):
+        push()
+
+    agent = DQNAgent(device="cpu", batch_size=64)
+    for i in range(len(states)):
+        agent.store_transition(states[i], i, float(i % 3), states[-i], i % 50 == 0, masks[i])
+    samples = []
+    for board in positions[:200]:
+        env.set_board(board.copy())
+        if env.get_legal_actions():
+            samples.append((env.get_state(), env.get_legal_actions(), env.get_legal_mask()))
+
+    def mini_training():
+        from train import train_agent
+        trained = train_agent(episodes=1_000, num_envs=4, max_env_steps=256, save_path=None, seed=0, device="cpu")
+        # Soma dos pesos: deve ser igual em todas as execuções com a mesma semente
+        mini_training.checksum = float(sum(p.detach().double().sum() for p in trained.policy_net.parameters()))
+
+    return [
+        ("env.get_state", get_state, len(positions)),
+        ("env.get_legal_actions", get_legal_actions, len(positions)),
+        ("env.step", step, sum(len(g) for g in games)),
+        ("replay.push", push, len(states)),
+        ("replay.sample", lambda: buffer.sample(64), 1),
+        ("agent.select_action", lambda: [agent.select_action(s[0], s[1], 0.0, s[2]) for s in samples], len(samples)),
+        ("agent.optimize_model", lambda: agent.optimize_model(5), 5),
+        ("train.mini_run", mini_training, 256),
+    ], mini_training
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "torch": torch.__version__,
+        "numpy": np.__version__,
+        "chess": chess.__version__,
+    }
+
+# Repetições mínimas para o mínimo de cada caso ser estável o bastante para comparar
+MIN_BASELINE_REPEAT = 5
+
+def _measure(fn, ops, repeat, min_seconds):
+    """Tempos (µs por operação) de pelo menos `repeat` execuções de fn, e das que couberem em min_seconds"""
+    times = []
+    end = time.perf_counter() + min_seconds
+    while len(times) < repeat or time.perf_counter() < end:
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) / ops * 1e6)
+    return times
+
+def _summary(times, ops):
+    return {"us_per_op": statistics.median(times), "min_us_per_op": min(times),
+            "stdev_us": statistics.stdev(times) if len(times) > 1 else 0.0, "ops": ops, "runs": len(times)}
+
+def bench_suite(out=None, baseline=None, tolerance=0.5, repeat=10, threads=1, min_seconds=1.0):
+    """
+    Conjunto reprodutível de benchmarks (CPU, sementes fixas), gravado em JSON.
+    Com um baseline, é regressão o caso cujo mínimo passa (1 + tolerance) vezes
+    o guardado, também depois de o medir outra vez.
+    """
+    if baseline and repeat < MIN_BASELINE_REPEAT:
+        raise ValueError(f"a comparação com o baseline precisa de repeat >= {MIN_BASELINE_REPEAT}")
+    torch.set_num_threads(threads)
+    cases, mini_training = _suite_cases()
+    results = {}
+    all_times = {}
+    for name, fn, ops in cases:
+        fn() # Aquecimento
+        all_times[name] = _measure(fn, ops, repeat, min_seconds)
+        results[name] = _summary(all_times[name], ops)
+        print(f"{name:>22}: {results[name]['us_per_op']:10.1f} µs/op  (mín {results[name]['min_us_per_op']:.1f})")
+    results["train.mini_run"]["checksum"] = mini_training.checksum
+
+    report = {"machine": machine_info(), "repeat": repeat, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "results": results}
+    regressions = []
+    if baseline:
+        with open(baseline) as f:
+            base = json.load(f)["results"]
+        for name, fn, ops in cases:
+            if name in base and results[name]["min_us_per_op"] > (1 + tolerance) * base[name]["min_us_per_op"]:
+                # Confirmar: uma fase lenta da máquina não deve contar como regressão
+                all_times[name] += _measure(fn, ops, repeat, min_seconds)
+                results[name].update(_summary(all_times[name], ops))
+        for name, result in results.items():
+            if name not in base:
+                continue
+            ratio = result["min_us_per_op"] / base[name]["min_us_per_op"]
+            result["vs_baseline"] = ratio
+            flag = ""
+            if ratio > 1 + tolerance:
+                regressions.append(name)
+                flag = "  <-- REGRESSÃO"
+            print(f"{name:>22}: {ratio:5.2f}x o baseline{flag}")
+        if "checksum" in base.get("train.mini_run", {}) and \
+                base["train.mini_run"]["checksum"] != results["train.mini_run"]["checksum"]:
+            print("Aviso: o treino curto deu pesos diferentes do baseline (mudou o comportamento?)")
+        report["regressions"] = regressions
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados gravados em '{out}'.")
+    return report, regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks do pacote de xadrez")
+    parser.add_argument("bench", choices=["replay", "compact", "state", "step", "select", "vector", "actors", "inference", "schedule", "amp", "cache", "search", "per", "head", "suite"])
+    parser.add_argument("--capacities", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--compile", action="store_true", help="amp: incluir também torch.compile")
+    parser.add_argument("--out", default=None, help="suite: ficheiro JSON para os resultados")
+    parser.add_argument("--baseline", default=None, help="suite: JSON de uma execução anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="suite: abrandamento relativo a partir do qual um caso é regressão")
+    parser.add_argument("--repeat", type=int, default=10, help="suite: repetições mínimas por caso")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="suite: tempo mínimo de medição por caso")
+    args = parser.parse_args()
+
+    if args.bench == "replay":
+        bench_replay(args.capacities, args.batch_size)
+    elif args.bench == "compact":
+        bench_compact(batch_size=args.batch_size)
+    elif args.bench == "state":
+        bench_state()
+    elif args.bench == "step":
+        bench_step()
+    elif args.bench == "select":
+        bench_select(device="cuda" if torch.cuda.is_available() else "cpu")
+    elif args.bench == "vector":
+        bench_vector(device="cuda" if torch.cuda.is_available() else "cpu")
+    elif args.bench == "actors":
+        bench_actors()
+    elif args.bench == "inference":
+        bench_inference()
+    elif args.bench == "schedule":
+        bench_schedule()
+    elif args.bench == "amp":
+        bench_amp(compile_model=args.compile, device="cuda" if torch.cuda.is_available() else "cpu")
+    elif args.bench == "cache":
+        bench_cache()
+    elif args.bench == "search":
+        bench_search()
+    elif args.bench == "per":
+        bench_per(batch_size=args.batch_size)
+    elif args.bench == "head":
+        bench_head(args.batch_size, device="cuda" if torch.cuda.is_available() else "cpu")
+    elif args.bench == "suite":
+        if args.baseline and args.repeat < MIN_BASELINE_REPEAT:
+            parser.error(f"--baseline precisa de --repeat >= {MIN_BASELINE_REPEAT}")
+        _, regressions = bench_suite(args.out, args.baseline, args.tolerance, args.repeat,
+                                     min_seconds=args.min_seconds)
+        if regressions:
+            raise SystemExit(f"Regressões: {', '.join(regressions)}")
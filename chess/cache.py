@@ -0,0 +1,68 @@
+from collections import OrderedDict
+
+import chess.polyglot
+
+def position_key(board):
+    """Chave Zobrist (64 bits) da posição, a mesma do formato polyglot"""
+    return chess.polyglot.zobrist_hash(board)
+
+class PositionCache:
+    """
+    Cache LRU de avaliações por posição, indexada pela chave Zobrist.
+    Cada entrada guarda as ações legais e os respetivos Q-values (a versão
+    com máscara do vetor de 4096), com a versão dos pesos que a calculou:
+    quando os pesos mudam, as entradas antigas contam como falhas e são
+    substituídas.
+    """
+    def __init__(self, capacity=50_000):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0 # Falhas por a entrada ser de pesos antigos
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] != version:
+            self.stale += 1
+            self.misses += 1
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, version, value):
+        self._entries[key] = (version, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, key, version, compute):
+        value = self.get(key, version)
+        if value is None:
+            value = compute()
+            self.put(key, version, value)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
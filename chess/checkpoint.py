@@ -0,0 +1,47 @@
+import os
+import queue
+import threading
+
+import torch
+
+from model import checkpoint_state
+
+class CheckpointWriter:
+    """
+    Grava os pesos da rede numa thread em segundo plano, para o treino não
+    parar à espera do disco. Só a cópia mais recente fica pendente: se a
+    gravação anterior ainda não acabou, a cópia antiga é descartada.
+    O ficheiro é escrito num temporário e depois renomeado, por isso nunca
+    fica um checkpoint a meio. O formato é o de model.save_checkpoint
+    (cabeça da rede e pesos).
+    """
+    def __init__(self, path="chess_dqn.pth"):
+        self.path = path
+        self._pending = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.saved = 0
+
+    def save(self, net):
+        # A cópia para CPU é feita já, para os pesos não mudarem durante a escrita
+        state_dict = checkpoint_state(net)
+        try:
+            self._pending.get_nowait()
+        except queue.Empty:
+            pass
+        self._pending.put(state_dict)
+
+    def _run(self):
+        while True:
+            state_dict = self._pending.get()
+            if state_dict is None:
+                break
+            tmp_path = self.path + ".tmp"
+            torch.save(state_dict, tmp_path)
+            os.replace(tmp_path, self.path)
+            self.saved += 1
+
+    def close(self):
+        """Espera pela última gravação pendente"""
+        self._pending.put(None)
+        self._thread.join()
@@ -1,9 +1,68 @@
+import random
 import chess
 import numpy as np
+from cache import position_key
+from profiling import profiler
+
+# Número de ações possíveis (from_sq * 64 + to_sq)
+NUM_ACTIONS = 4096
+# Codificação com promoções: as mesmas 4096 ações (a promoção a Dama mantém o
+# índice from_sq * 64 + to_sq) e mais 72 para as sub-promoções, como nos planos
+# do AlphaZero: coluna de partida (8) x direção (3) x peça (Cavalo, Bispo, Torre)
+NUM_PROMOTION_ACTIONS = NUM_ACTIONS + 8 * 3 * 3
+
+def action_index(move, flip=0, promotions=False):
+    """Índice da ação de uma jogada, com as casas já viradas (flip=63 quando jogam as pretas)"""
+    from_sq, to_sq = move.from_square ^ flip, move.to_square ^ flip
+    if promotions and move.promotion and move.promotion != chess.QUEEN:
+        direction = (to_sq & 7) - (from_sq & 7) + 1
+        return NUM_ACTIONS + ((from_sq & 7) * 3 + direction) * 3 + move.promotion - chess.KNIGHT
+    return from_sq * 64 + to_sq
+
+def action_squares():
+    """
+    Para cada índice da codificação com promoções: casa de partida, casa de
+    chegada e sub-promoção (0 = nenhuma ou Dama, 1..3 = Cavalo, Bispo, Torre),
+    na perspetiva de quem joga. Devolve três arrays (NUM_PROMOTION_ACTIONS,).
+    """
+    idx = np.arange(NUM_PROMOTION_ACTIONS)
+    from_sq, to_sq, promotion = idx // 64, idx % 64, np.zeros_like(idx)
+    under = idx[NUM_ACTIONS:] - NUM_ACTIONS
+    file, direction = under // 9, under // 3 % 3
+    from_sq[NUM_ACTIONS:] = 48 + file
+    # As combinações que saem do tabuleiro nunca são legais; ficam numa casa qualquer
+    to_sq[NUM_ACTIONS:] = 56 + np.clip(file + direction - 1, 0, 7)
+    promotion[NUM_ACTIONS:] = under % 3 + 1
+    return from_sq, to_sq, promotion
+
+def legal_mask(legal_actions, num_actions=NUM_ACTIONS):
+    """Máscara booleana (num_actions,) com True nos índices das jogadas legais"""
+    mask = np.zeros(num_actions, dtype=np.bool_)
+    mask[list(legal_actions)] = True
+    return mask
+
+def legal_actions(board, promotions=False):
+    """
+    Dicionário {action_idx: move} das jogadas legais de um tabuleiro qualquer
+    (ver ChessEnv). Com promotions=True as sub-promoções têm índices próprios.
+    """
+    actions = {}
+    flip = 63 if board.turn == chess.BLACK else 0
+    
+    for move in board.legal_moves:
+        action_idx = action_index(move, flip, promotions)
+        if action_idx not in actions:
+            actions[action_idx] = move
+        
+    return actions
 
 class ChessEnv:
-    def __init__(self):
+    def __init__(self, promotions=False):
         self.board = chess.Board()
+        # Codificação das ações: 4096 (sub-promoções viram Dama) ou com as
+        # sub-promoções (NUM_PROMOTION_ACTIONS, para a rede LegalMoveDQN)
+        self.promotions = promotions
+        self.num_actions = NUM_PROMOTION_ACTIONS if promotions else NUM_ACTIONS
         # Valoração simples das peças para guiar o agente
         self.piece_values = {
             chess.PAWN: 1,
@@ -13,9 +72,22 @@ class ChessEnv:
             chess.QUEEN: 9,
             chess.KING: 0
         }
+        # Cache das jogadas legais da posição atual (invalidada a cada jogada)
+        self._legal_actions = None
+        self._legal_mask = None
+        # Balanço material (brancas - pretas), atualizado incrementalmente
+        self.material = 0
         
     def reset(self):
         self.board.reset()
+        return self.set_board(self.board)
+
+    def set_board(self, board):
+        """Coloca o ambiente numa posição arbitrária (limpa as caches e reconta o material)"""
+        self.board = board
+        self._legal_actions = None
+        self._legal_mask = None
+        self.material = self._get_material_score(chess.WHITE) - self._get_material_score(chess.BLACK)
         return self.get_state(), self.get_legal_actions()
         
     def get_state(self):
@@ -25,49 +97,38 @@ class ChessEnv:
         O tabuleiro é sempre virado para que o agente veja as suas peças
         na base (rank 0) a avançar para o topo (rank 7).
         """
-        state = np.zeros((12, 8, 8), dtype=np.float32)
-        turn = self.board.turn # Jogador atual
-        
-        for piece_type in range(1, 7):
-            for color in [chess.WHITE, chess.BLACK]:
-                squares = self.board.pieces(piece_type, color)
-                is_current_player = (color == turn)
-                channel = (piece_type - 1) + (0 if is_current_player else 6)
-                
-                for sq in squares:
-                    rank = chess.square_rank(sq)
-                    file = chess.square_file(sq)
-                    
-                    # Virar o tabuleiro se formos as pretas 
-                    if turn == chess.BLACK:
-                        rank = 7 - rank
-                        file = 7 - file
-                        
-                    state[channel, rank, file] = 1.0
-                    
-        return state
+        return unpack_planes(encode_board(self.board)).astype(np.float32)
+
+    def get_packed_state(self):
+        """Mesmo estado que get_state, mas em 12 bitboards de 64 bits (ver pack_planes)"""
+        return encode_board(self.board)
 
     def get_legal_actions(self):
         """
-        Retorna uma lista de tuplos (action_idx, move).
+        Retorna um dicionário {action_idx: move} com as jogadas legais.
         O índice de ação é calculado como (from_sq * 64 + to_sq), lidando
-        também com a perspetiva de virar o tabuleiro.
+        também com a perspetiva de virar o tabuleiro. Se houver várias jogadas
+        com o mesmo índice (promoções), fica a primeira gerada (Dama); com
+        promotions=True as sub-promoções têm índices próprios (ver action_index).
+        O resultado fica em cache até à próxima jogada, por isso não deve ser
+        modificado por quem o chama.
         """
-        actions = []
-        turn = self.board.turn
-        
-        for move in self.board.legal_moves:
-            from_sq = move.from_square
-            to_sq = move.to_square
-            
-            if turn == chess.BLACK:
-                from_sq = from_sq ^ 63
-                to_sq = to_sq ^ 63
-                
-            action_idx = from_sq * 64 + to_sq
-            actions.append((action_idx, move))
-            
-        return actions
+        if self._legal_actions is None:
+            self._legal_actions = legal_actions(self.board, self.promotions)
+        return self._legal_actions
+
+    def get_legal_mask(self):
+        """
+        Máscara booleana de tamanho num_actions com as jogadas legais da
+        posição atual, para fazer o masking diretamente na rede (também em cache).
+        """
+        if self._legal_mask is None:
+            self._legal_mask = legal_mask(self.get_legal_actions(), self.num_actions)
+        return self._legal_mask
+
+    def position_key(self):
+        """Chave Zobrist da posição atual (para a cache de avaliações)"""
+        return position_key(self.board)
 
     def _get_material_score(self, color):
         """Calcula a pontuação em material de uma dada cor"""
@@ -76,54 +137,199 @@ class ChessEnv:
             score += len(self.board.pieces(piece_type, color)) * self.piece_values[piece_type]
         return score
 
+    def _material_gain(self, move):
+        """Ganho de material de quem joga `move` (capturas e promoções), antes de a jogar"""
+        gain = 0
+        if self.board.is_capture(move):
+            if self.board.is_en_passant(move):
+                gain += self.piece_values[chess.PAWN]
+            else:
+                gain += self.piece_values[self.board.piece_type_at(move.to_square)]
+        if move.promotion:
+            gain += self.piece_values[move.promotion] - self.piece_values[chess.PAWN]
+        return gain
+
+    def _is_game_over(self, legal_actions):
+        """Igual a board.is_game_over(), reaproveitando as jogadas legais já geradas"""
+        return (not legal_actions
+                or self.board.is_insufficient_material()
+                or self.board.is_seventyfive_moves()
+                or self.board.is_fivefold_repetition())
+
     def step(self, action_idx):
         """
         Avança um passo no ambiente ao executar uma jogada.
         """
-        legal_actions = self.get_legal_actions()
-        move = None
-        
-        # Encontrar a jogada que corresponde ao índice
-        # Se houver várias (ex: promoções diferentes), a primeira é selecionada (geralmente Dama)
-        for idx, m in legal_actions:
-            if idx == action_idx:
-                move = m
-                break
+        move = self.get_legal_actions().get(action_idx)
                 
         if move is None:
             # Caso o agente tente jogada ilegal (não deve acontecer devido a masking)
-            return self.get_state(), -10, True, {"error": "Invalid action", "legal_actions": self.get_legal_actions()}
+            return self.get_state(), -10, True, {"error": "Invalid action", "legal_actions": self.get_legal_actions(),
+                                                 "legal_mask": self.get_legal_mask()}
             
         current_turn = self.board.turn
         
-        my_material_before = self._get_material_score(current_turn)
-        opp_material_before = self._get_material_score(not current_turn)
-        adv_before = my_material_before - opp_material_before
+        # A recompensa é o ganho de vantagem de material (capturas e promoções)
+        reward = self._material_gain(move)
+        self.material += reward if current_turn == chess.WHITE else -reward
         
         # Fazer a jogada
         self.board.push(move)
-        
-        my_material_after = self._get_material_score(current_turn)
-        opp_material_after = self._get_material_score(not current_turn)
-        adv_after = my_material_after - opp_material_after
-        
-        # A recompensa é o ganho de vantagem de material
-        reward = adv_after - adv_before
+        self._legal_actions = None
+        self._legal_mask = None
+        with profiler.span("env.movegen"):
+            legal_actions = self.get_legal_actions()
         
         # Adicionar recompensa por acabar o jogo
-        done = self.board.is_game_over()
-        if done:
-            result = self.board.result()
-            if result == "1-0":
-                reward += 100 if current_turn == chess.WHITE else -100
-            elif result == "0-1":
-                reward += 100 if current_turn == chess.BLACK else -100
-            # Empate dá apenas 0
+        with profiler.span("env.game_over"):
+            done = self._is_game_over(legal_actions)
+            if done and not legal_actions and self.board.is_check():
+                # Xeque-mate: só quem acabou de jogar pode ter ganho
+                reward += 100
+                # Empate dá apenas 0
                 
-        info = {"legal_actions": self.get_legal_actions() if not done else []}
-        return self.get_state(), reward, done, info
+        with profiler.span("env.encode"):
+            if done:
+                info = {"legal_actions": {}, "legal_mask": np.zeros(self.num_actions, dtype=np.bool_)}
+            else:
+                info = {"legal_actions": legal_actions, "legal_mask": self.get_legal_mask()}
+            state = self.get_state()
+        profiler.count("env.legal_moves", len(legal_actions))
+        return state, reward, done, info
 
     def render(self):
         """Mostra o tabuleiro na consola"""
         print(self.board)
         print("-" * 20)
+
+# Tabela para inverter a ordem dos bits de um byte
+_REVERSED_BITS = np.array([int(f"{i:08b}"[::-1], 2) for i in range(256)], dtype=np.uint8)
+
+def _piece_masks(board):
+    """Os 12 bitboards de ocupação (peão..rei), primeiro os do jogador atual"""
+    us = board.occupied_co[board.turn]
+    them = board.occupied_co[not board.turn]
+    pieces = (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings)
+    return [bb & us for bb in pieces] + [bb & them for bb in pieces]
+
+def _flip_masks(masks):
+    """
+    Vira bitboards (..., 12) para a perspetiva das pretas: a casa sq passa a
+    sq ^ 63, o que equivale a inverter os 64 bits de cada bitboard.
+    """
+    as_bytes = masks.view(np.uint8).reshape(*masks.shape, 8)
+    return _REVERSED_BITS[as_bytes[..., ::-1]].view("<u8").reshape(masks.shape)
+
+def encode_board(board):
+    """
+    Codifica um chess.Board diretamente a partir dos bitboards do python-chess,
+    sem percorrer as casas. Devolve 12 bitboards (uint64) já na perspetiva do
+    jogador atual, no formato de pack_planes.
+    """
+    masks = np.array(_piece_masks(board), dtype="<u8")
+    if board.turn == chess.BLACK:
+        masks = _flip_masks(masks)
+    return masks
+
+def encode_boards(boards):
+    """
+    Versão em lote de ChessEnv.get_state: codifica N tabuleiros de uma vez
+    e devolve um array (N, 12, 8, 8) em float32.
+    """
+    masks = np.array([_piece_masks(b) for b in boards], dtype="<u8").reshape(-1, 12)
+    black = np.array([b.turn == chess.BLACK for b in boards], dtype=np.bool_)
+    if black.any():
+        masks[black] = _flip_masks(masks[black])
+    return unpack_planes(masks).astype(np.float32)
+
+def pack_planes(planes):
+    """
+    Compacta um estado 12 x 8 x 8 binário em 12 bitboards de 64 bits
+    (96 bytes). O bit i de cada bitboard corresponde à casa i = rank * 8 + file,
+    já na perspetiva do jogador atual.
+    """
+    bits = np.packbits(planes.reshape(12, 64) > 0, axis=1, bitorder="little")
+    return bits.view("<u8").reshape(12)
+
+def unpack_planes(packed):
+    """
+    Operação inversa de pack_planes, feita em lote.
+    Recebe um array (..., 12) de uint64 e devolve (..., 12, 8, 8) em uint8.
+    """
+    packed = np.ascontiguousarray(packed, dtype="<u8")
+    bits = np.unpackbits(packed.view(np.uint8).reshape(*packed.shape, 8), axis=-1, bitorder="little")
+    return bits.reshape(*packed.shape, 8, 8)
+
+class VectorChessEnv:
+    """
+    N jogos de xadrez em paralelo, avançados em lockstep, para que a rede
+    escolha as jogadas de todos os tabuleiros numa só forward pass.
+    Cada passo é uma jogada do agente seguida (opcionalmente) da resposta
+    de um oponente aleatório, tal como no train.py. Os jogos que acabam são
+    recomeçados automaticamente.
+    """
+    def __init__(self, num_envs, random_opponent=True, seed=None, promotions=False):
+        self.envs = [ChessEnv(promotions) for _ in range(num_envs)]
+        self.num_envs = num_envs
+        self.random_opponent = random_opponent
+        self.rng = random.Random(seed)
+        # Observações atuais (já depois dos recomeços automáticos)
+        self.states = np.zeros((num_envs, 12, 8, 8), dtype=np.float32)
+        self.masks = np.zeros((num_envs, self.envs[0].num_actions), dtype=np.bool_)
+        self.episode_rewards = np.zeros(num_envs, dtype=np.float32)
+        self.episode_steps = np.zeros(num_envs, dtype=np.int64)
+        # (recompensa, passos) dos jogos terminados desde a última leitura
+        self.finished = []
+
+    def reset(self):
+        for i, env in enumerate(self.envs):
+            self._reset_env(i)
+        return self.states, self.masks
+
+    def _reset_env(self, i):
+        env = self.envs[i]
+        self.states[i], _ = env.reset()
+        self.masks[i] = env.get_legal_mask()
+        self.episode_rewards[i] = 0
+        self.episode_steps[i] = 0
+
+    def step(self, actions):
+        """
+        Aplica uma ação por tabuleiro. Devolve (next_states, rewards, dones,
+        next_masks), prontos a guardar como transições: nos jogos que acabaram,
+        next_states tem o estado terminal. As observações para o passo seguinte
+        ficam em self.states e self.masks.
+        """
+        next_states = np.empty_like(self.states)
+        next_masks = np.empty_like(self.masks)
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=np.bool_)
+
+        for i, env in enumerate(self.envs):
+            next_state, reward, done, info = env.step(int(actions[i]))
+            if not done and self.random_opponent:
+                # Resposta do oponente: a recompensa é a vantagem do agente MENOS a do oponente
+                opp_action = self.rng.choice(list(info["legal_actions"]))
+                next_state, reward_opp, done, info = env.step(opp_action)
+                reward -= reward_opp
+
+            next_states[i] = next_state
+            next_masks[i] = info["legal_mask"]
+            rewards[i] = reward
+            dones[i] = done
+            self.episode_rewards[i] += reward
+            self.episode_steps[i] += 1
+
+            if done:
+                self.finished.append((float(self.episode_rewards[i]), int(self.episode_steps[i])))
+                self._reset_env(i)
+            else:
+                self.states[i] = next_state
+                self.masks[i] = next_masks[i]
+
+        return next_states, rewards, dones, next_masks
+
+    def pop_finished(self):
+        """Devolve e esquece os resultados dos jogos terminados"""
+        finished, self.finished = self.finished, []
+        return finished
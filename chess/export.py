@@ -0,0 +1,104 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from agent import DQNAgent
+from env import ChessEnv
+from inference import InferenceAgent
+from model import load_checkpoint, load_net
+
+def quantize(net):
+    """
+    Quantização dinâmica int8 das camadas densas (fc1 e fc2 têm quase todos
+    os 12.6M parâmetros); as convoluções ficam em fp32.
+    """
+    net.eval()
+    return torch.ao.quantization.quantize_dynamic(net, {nn.Linear}, dtype=torch.qint8)
+
+def export_quantized(weights_path="chess_dqn.pth", out_path="chess_dqn_int8.pt", threshold=0.95):
+    """
+    Gera um modelo TorchScript congelado e quantizado, pronto para o
+    InferenceAgent (com a cabeça da rede gravada no ficheiro). Só é gravado
+    em out_path se a concordância de jogadas com o modelo fp32 chegar a
+    `threshold`. Devolve (rede fp32, modelo int8, concordância, posições de teste).
+    """
+    net = load_net(weights_path)
+    qnet = quantize(net)
+    example = torch.zeros(1, 12, 8, 8)
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(qnet, example).eval())
+    states, masks = test_positions(promotions=net.head == "compact")
+    agreement = move_agreement(net, scripted, states, masks)
+    if agreement >= threshold:
+        # Ficheiro temporário + os.replace: o play.py nunca vê um modelo a meio
+        scripted.save(out_path + ".tmp", _extra_files={"head": net.head})
+        os.replace(out_path + ".tmp", out_path)
+    return net, scripted, agreement, states
+
+def test_positions(n=500, seed=0, promotions=False):
+    """Conjunto fixo de posições (jogos aleatórios com semente) para comparar modelos"""
+    rng = np.random.default_rng(seed)
+    env = ChessEnv(promotions)
+    states, masks = [], []
+    state, legal_actions = env.reset()
+    while len(states) < n:
+        states.append(state)
+        masks.append(env.get_legal_mask())
+        actions = sorted(legal_actions)
+        state, _, done, info = env.step(actions[rng.integers(len(actions))])
+        legal_actions = info["legal_actions"]
+        if done:
+            state, legal_actions = env.reset()
+    return np.stack(states), np.stack(masks)
+
+def move_agreement(reference, candidate, states, masks):
+    """Fração das posições em que os dois modelos escolhem a mesma jogada legal"""
+    with torch.no_grad():
+        x = torch.from_numpy(states)
+        mask = torch.from_numpy(masks)
+        a = reference(x).masked_fill(~mask, -float('inf')).argmax(1)
+        b = candidate(x).masked_fill(~mask, -float('inf')).argmax(1)
+    return (a == b).float().mean().item()
+
+def _latency_ms(model, states, repeat=200):
+    x = torch.from_numpy(states[:1])
+    with torch.no_grad():
+        for _ in range(10):
+            model(x)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            model(x)
+    return (time.perf_counter() - start) / repeat * 1e3
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exportar a ChessDQN quantizada (int8) para inferência")
+    parser.add_argument("--weights", default="chess_dqn.pth")
+    parser.add_argument("--out", default="chess_dqn_int8.pt")
+    parser.add_argument("--threshold", type=float, default=0.95,
+                        help="Concordância mínima de jogadas com o modelo fp32")
+    args = parser.parse_args()
+
+    net, scripted, agreement, states = export_quantized(args.weights, args.out, args.threshold)
+    print(f"Concordância de jogadas em {len(states)} posições: {agreement:.1%} (mínimo {args.threshold:.0%})")
+    if agreement < args.threshold:
+        raise SystemExit(f"Concordância abaixo do limite: o modelo quantizado não foi gravado em '{args.out}'.")
+
+    # Tempo até o agente estar pronto a jogar: DQNAgent completo vs InferenceAgent
+    start = time.perf_counter()
+    head, state_dict = load_checkpoint(args.weights)
+    agent = DQNAgent(device="cpu", head=head)
+    agent.policy_net.load_state_dict(state_dict)
+    full_startup = time.perf_counter() - start
+    start = time.perf_counter()
+    InferenceAgent(args.out)
+    inference_startup = time.perf_counter() - start
+
+    print(f"Tamanho: {os.path.getsize(args.weights) / 1e6:.1f} MB (fp32) -> "
+          f"{os.path.getsize(args.out) / 1e6:.1f} MB (int8)")
+    print(f"Arranque do agente: {full_startup * 1e3:.0f} ms (DQNAgent) -> {inference_startup * 1e3:.0f} ms (InferenceAgent)")
+    print(f"Latência por jogada: {_latency_ms(net, states):.2f} ms (fp32) -> {_latency_ms(scripted, states):.2f} ms (int8)")
+    print(f"Modelo exportado para '{args.out}'.")
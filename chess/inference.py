@@ -0,0 +1,253 @@
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+from agent import epsilon_greedy, masked_argmax
+from env import NUM_ACTIONS, NUM_PROMOTION_ACTIONS, legal_mask as build_legal_mask
+
+class InferenceAgent:
+    """
+    Agente só para jogar: carrega o modelo TorchScript quantizado gerado pelo
+    export.py, sem rede alvo, otimizador nem memória de repetição. A cabeça
+    da rede vem gravada no ficheiro (os modelos antigos, sem ela, são da
+    cabeça densa).
+    """
+    def __init__(self, path="chess_dqn_int8.pt"):
+        extra_files = {"head": ""}
+        self.net = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+        self.net.eval()
+        head = extra_files["head"]
+        self.head = (head.decode() if isinstance(head, bytes) else head) or "dense"
+        self.promotions = self.head == "compact"
+        self.num_actions = NUM_PROMOTION_ACTIONS if self.promotions else NUM_ACTIONS
+        self.device = torch.device("cpu")
+
+    def select_action(self, state, legal_actions, epsilon=0.0, legal_mask=None, position_key=None):
+        """Mesma interface que DQNAgent.select_action (sem cache, position_key é ignorada)"""
+        if not legal_actions:
+            return None
+        if np.random.random() < epsilon:
+            return int(np.random.choice(list(legal_actions)))
+        if legal_mask is None:
+            legal_mask = build_legal_mask(legal_actions, self.num_actions)
+        return int(masked_argmax(self.net, state[None], legal_mask[None])[0])
+
+    def select_actions(self, states, legal_masks, epsilon):
+        """Mesma interface que DQNAgent.select_actions"""
+        return epsilon_greedy(states, legal_masks, epsilon, lambda s, m: masked_argmax(self.net, s, m))
+
+class _Request:
+    __slots__ = ("states", "masks", "future", "submitted")
+
+    def __init__(self, states, masks):
+        self.states = states
+        self.masks = masks
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+class InferenceServer:
+    """
+    Serviço de inferência em lote para a ChessDQN.
+    Junta os pedidos de select_action de várias threads (ou processos, via
+    InferenceClient) até max_batch tabuleiros ou até passarem max_wait_ms
+    desde o primeiro pedido, faz uma só forward pass e devolve a cada um a
+    sua jogada (argmax com máscara das jogadas legais). O número de ações e
+    a codificação (com ou sem sub-promoções) são os da cabeça da rede servida.
+    """
+    def __init__(self, net, device="cpu", max_batch=64, max_wait_ms=2.0, ctx=None):
+        self.net = net
+        self.head = getattr(net, "head", "dense")
+        self.promotions = self.head == "compact"
+        self.num_actions = NUM_PROMOTION_ACTIONS if self.promotions else NUM_ACTIONS
+        self.device = torch.device(device)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._requests = queue.Queue()
+        self._weights_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+        # Estatísticas: histograma dos tamanhos de lote e latências recentes
+        self.batch_sizes = Counter()
+        self.latencies = deque(maxlen=10000)
+
+        # Pedidos de outros processos chegam por uma fila de multiprocessing
+        self._ctx = ctx
+        self._process_requests = ctx.Queue() if ctx is not None else None
+        self._responses = []
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._serve, daemon=True)]
+        if self._process_requests is not None:
+            self._threads.append(threading.Thread(target=self._pump_processes, daemon=True))
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        """Para o serviço; os pedidos ainda por responder falham com RuntimeError"""
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+        error = RuntimeError("InferenceServer parado antes de responder ao pedido")
+        while True:
+            try:
+                self._requests.get_nowait().future.set_exception(error)
+            except queue.Empty:
+                break
+        if self._process_requests is not None:
+            while True:
+                try:
+                    client_id, request_id, _, _ = self._process_requests.get(timeout=0.05)
+                except queue.Empty:
+                    break
+                self._responses[client_id].put((request_id, None, str(error)))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def submit(self, states, masks):
+        """
+        Pede as jogadas para um ou mais tabuleiros, (N, 12, 8, 8) e (N, num_actions).
+        Devolve um Future com o array das N ações escolhidas.
+        """
+        request = _Request(states, masks)
+        self._requests.put(request)
+        return request.future
+
+    def select_action(self, state, legal_actions, epsilon, legal_mask=None, position_key=None):
+        """Mesma interface que DQNAgent.select_action, mas servida em lote (position_key é ignorada)"""
+        if not legal_actions:
+            return None
+        if np.random.random() < epsilon:
+            return int(np.random.choice(list(legal_actions)))
+        if legal_mask is None:
+            legal_mask = build_legal_mask(legal_actions, self.num_actions)
+        return int(self.submit(state[None], legal_mask[None]).result()[0])
+
+    def select_actions(self, states, legal_masks, epsilon):
+        """Mesma interface que DQNAgent.select_actions"""
+        return epsilon_greedy(states, legal_masks, epsilon, lambda s, m: self.submit(s, m).result())
+
+    def load_state_dict(self, state_dict):
+        """Atualiza os pesos sem parar o serviço (entre duas forward passes)"""
+        with self._weights_lock:
+            self.net.load_state_dict(state_dict)
+
+    def connect(self):
+        """Cria um cliente para outro processo (tem de ser chamado antes de o lançar)"""
+        if self._process_requests is None:
+            raise RuntimeError("InferenceServer criado sem ctx de multiprocessing")
+        responses = self._ctx.Queue()
+        self._responses.append(responses)
+        return InferenceClient(len(self._responses) - 1, self._process_requests, responses)
+
+    def _pump_processes(self):
+        # Reencaminha os pedidos dos processos para a fila interna
+        while not self._stop.is_set():
+            try:
+                client_id, request_id, states, masks = self._process_requests.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            future = self.submit(states, np.unpackbits(masks, axis=1).astype(np.bool_))
+            future.add_done_callback(lambda f, r=self._responses[client_id], i=request_id: _reply(r, i, f))
+
+    def _collect(self):
+        try:
+            first = self._requests.get(timeout=0.05)
+        except queue.Empty:
+            return []
+        batch = [first]
+        rows = len(first.states)
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            rows += len(request.states)
+        return batch
+
+    def _serve(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            states = np.concatenate([r.states for r in batch])
+            masks = np.concatenate([r.masks for r in batch])
+            try:
+                with self._weights_lock:
+                    actions = masked_argmax(self.net, states, masks, self.device)
+            except Exception as e:
+                # Não deixar os clientes à espera para sempre
+                for r in batch:
+                    r.future.set_exception(e)
+                continue
+
+            self.batch_sizes[len(states)] += 1
+            done = time.perf_counter()
+            start = 0
+            for r in batch:
+                n = len(r.states)
+                self.latencies.append(done - r.submitted)
+                r.future.set_result(actions[start:start + n])
+                start += n
+
+    def stats(self):
+        """Histograma dos tamanhos de lote e latências p50/p99 (ms) por pedido"""
+        latencies = np.array(self.latencies) * 1e3
+        return {
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "requests": len(latencies),
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        }
+
+def _reply(responses, request_id, future):
+    # Resposta para outro processo: (id, ações, None), ou (id, None, erro) se a
+    # forward pass falhou, para o cliente não ficar à espera para sempre
+    error = future.exception()
+    if error is not None:
+        responses.put((request_id, None, repr(error)))
+    else:
+        responses.put((request_id, future.result(), None))
+
+class InferenceClient:
+    """
+    Lado do cliente do InferenceServer para outros processos (por exemplo os
+    atores do actors.py). É passado ao processo filho no arranque.
+    """
+    def __init__(self, client_id, requests, responses):
+        self.client_id = client_id
+        self.requests = requests
+        self.responses = responses
+        self._next_id = 0
+
+    def _request(self, states, legal_masks):
+        request_id = self._next_id
+        self._next_id += 1
+        # Estados em uint8 e máscaras em bits para reduzir a cópia entre processos
+        self.requests.put((self.client_id, request_id, states.astype(np.uint8),
+                           np.packbits(legal_masks, axis=1)))
+        response_id, result, error = self.responses.get()
+        while response_id != request_id:
+            response_id, result, error = self.responses.get()
+        if error is not None:
+            raise RuntimeError(f"Falha no InferenceServer: {error}")
+        return result
+
+    def select_actions(self, states, legal_masks, epsilon):
+        """Mesma interface que DQNAgent.select_actions"""
+        return epsilon_greedy(states, legal_masks, epsilon, self._request)
@@ -2,7 +2,12 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+from env import NUM_ACTIONS, action_squares
+
 class ChessDQN(nn.Module):
+    # Nome da cabeça de ação (gravado nos checkpoints, ver save_checkpoint)
+    head = "dense"
+
     def __init__(self):
         super(ChessDQN, self).__init__()
         # Entrada: 12 canais (6 peças do agente, 6 do adversário) x 8 x 8
@@ -24,9 +29,108 @@ class ChessDQN(nn.Module):
         x = F.relu(self.conv3(x))
         
         # Flatten para preparar para as Linear Layers
-        x = x.view(x.size(0), -1) 
+        # (flatten em vez de view, para funcionar também com o layout channels-last)
+        x = torch.flatten(x, 1)
         
         x = F.relu(self.fc1(x))
         # Sem ReLU aqui porque os Q-values podem e devem ser negativos ou positivos
         x = self.fc2(x)
         return x
+
+
+class LegalMoveDQN(nn.Module):
+    """
+    Variante da ChessDQN sem as camadas densas (fc1 e a fc2 de 1024 x 4096):
+    depois das mesmas convoluções, cada casa tem um embedding "de partida" e
+    um "de chegada" (convoluções 1x1), e o Q-value de uma jogada é o valor da
+    posição mais o produto escalar dos embeddings das suas duas casas (com o
+    da sub-promoção somado ao de partida). Usa a codificação com promoções
+    (NUM_PROMOTION_ACTIONS); score_actions avalia só as jogadas pedidas.
+    """
+    head = "compact"
+
+    def __init__(self, embed_dim=64):
+        super(LegalMoveDQN, self).__init__()
+        self.conv1 = nn.Conv2d(12, 64, kernel_size=3, padding=1)
+        self.conv2 = nn.Conv2d(64, 128, kernel_size=3, padding=1)
+        self.conv3 = nn.Conv2d(128, 128, kernel_size=3, padding=1)
+
+        self.from_head = nn.Conv2d(128, embed_dim, kernel_size=1)
+        self.to_head = nn.Conv2d(128, embed_dim, kernel_size=1)
+        # 0 = sem sub-promoção (vetor nulo), 1..3 = Cavalo, Bispo, Torre
+        self.promotion = nn.Embedding(4, embed_dim, padding_idx=0)
+        # Valor da posição, comum a todas as jogadas
+        self.value = nn.Linear(8192, 1)
+        self.scale = embed_dim ** -0.5
+
+        # Casas e peça de cada ação (não fazem parte dos pesos gravados)
+        from_sq, to_sq, promotion = (torch.from_numpy(a) for a in action_squares())
+        self.register_buffer("action_from", from_sq, persistent=False)
+        self.register_buffer("action_to", to_sq, persistent=False)
+        self.register_buffer("action_promotion", promotion, persistent=False)
+
+    def _features(self, x):
+        x = F.relu(self.conv1(x))
+        x = F.relu(self.conv2(x))
+        x = F.relu(self.conv3(x))
+        value = self.value(torch.flatten(x, 1))
+        # (batch, 64 casas, embed_dim)
+        from_emb = self.from_head(x).flatten(2).transpose(1, 2)
+        to_emb = self.to_head(x).flatten(2).transpose(1, 2)
+        return value, from_emb, to_emb
+
+    def forward(self, x):
+        """Q-values de todas as NUM_PROMOTION_ACTIONS ações (para o masking das jogadas legais)"""
+        value, from_emb, to_emb = self._features(x)
+        # As 4096 jogadas normais num só produto (64 x d) @ (d x 64) por tabuleiro
+        moves = torch.bmm(from_emb, to_emb.transpose(1, 2)).flatten(1)
+        under = slice(NUM_ACTIONS, None)
+        under_from = from_emb[:, self.action_from[under]] + self.promotion(self.action_promotion[under])
+        under_moves = (under_from * to_emb[:, self.action_to[under]]).sum(-1)
+        return value + self.scale * torch.cat([moves, under_moves], 1)
+
+    def score_actions(self, x, actions):
+        """Q-values só das ações `actions`, (batch,) ou (batch, K), sem calcular as restantes"""
+        value, from_emb, to_emb = self._features(x)
+        single = actions.dim() == 1
+        if single:
+            actions = actions.unsqueeze(1)
+        rows = torch.arange(len(actions), device=actions.device).unsqueeze(1)
+        action_from = from_emb[rows, self.action_from[actions]] + self.promotion(self.action_promotion[actions])
+        q_values = value + self.scale * (action_from * to_emb[rows, self.action_to[actions]]).sum(-1)
+        return q_values.squeeze(1) if single else q_values
+
+# Cabeças de ação disponíveis no DQNAgent
+HEADS = {"dense": ChessDQN, "compact": LegalMoveDQN}
+
+def build_net(head="dense"):
+    """Rede para a cabeça pedida: "dense" (4096 saídas) ou "compact" (LegalMoveDQN)"""
+    if head not in HEADS:
+        raise ValueError(f"cabeça desconhecida: {head!r} (opções: {', '.join(HEADS)})")
+    return HEADS[head]()
+
+def checkpoint_state(net):
+    """Conteúdo de um checkpoint: a cabeça da rede e uma cópia dos pesos em CPU"""
+    return {"head": net.head,
+            "state_dict": {k: v.detach().to("cpu", copy=True) for k, v in net.state_dict().items()}}
+
+def save_checkpoint(net, path):
+    torch.save(checkpoint_state(net), path)
+
+def load_checkpoint(path, map_location="cpu"):
+    """
+    Devolve (cabeça, state_dict) de um checkpoint. Os .pth antigos só têm o
+    state_dict e são sempre da cabeça densa.
+    """
+    data = torch.load(path, map_location=map_location)
+    if isinstance(data, dict) and "head" in data and "state_dict" in data:
+        return data["head"], data["state_dict"]
+    return "dense", data
+
+def load_net(path, map_location="cpu"):
+    """Rede com a cabeça e os pesos do checkpoint (em modo eval)"""
+    head, state_dict = load_checkpoint(path, map_location)
+    net = build_net(head)
+    net.load_state_dict(state_dict)
+    net.eval()
+    return net
@@ -0,0 +1,324 @@
+import argparse
+import bz2
+import gzip
+import io
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import chess
+import chess.pgn
+import numpy as np
+import torch
+
+from env import ChessEnv, NUM_ACTIONS, encode_board, legal_actions, legal_mask, unpack_planes
+from replay import Batch
+
+# Uma transição por registo: o tabuleiro antes da jogada e depois da resposta
+# do adversário (ambos em 12 bitboards, na perspetiva de quem joga), como no
+# VectorChessEnv, e as jogadas legais em next_state (em bits, para o max do
+# alvo só contar jogadas legais). 712 bytes por transição.
+TRANSITION_DTYPE = np.dtype([
+    ("state", "<u8", (12,)),
+    ("next_state", "<u8", (12,)),
+    ("action", "<i2"),
+    ("reward", "<f4"),
+    ("done", "?"),
+    ("next_mask", "u1", (NUM_ACTIONS // 8,)),
+])
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+def iter_game_chunks(paths, games_per_chunk=256):
+    """
+    Lê os ficheiros PGN linha a linha e devolve blocos de texto com até
+    games_per_chunk jogos, sem fazer o parse (isso fica para os processos).
+    Só um bloco está em memória de cada vez.
+    """
+    for path in paths:
+        with _open_text(path) as f:
+            lines, games, in_moves = [], 0, False
+            for line in f:
+                if line.startswith("["):
+                    if in_moves:
+                        # Cabeçalho depois de lances: começou outro jogo
+                        games += 1
+                        in_moves = False
+                        if games >= games_per_chunk:
+                            yield "".join(lines)
+                            lines, games = [], 0
+                elif line.strip():
+                    in_moves = True
+                lines.append(line)
+            if lines:
+                yield "".join(lines)
+
+def game_transitions(game, env=None):
+    """
+    Percorre a linha principal de um jogo com a codificação do ChessEnv e
+    devolve as transições de ambas as cores: estado, ação (índice 0-4095 na
+    perspetiva de quem joga), recompensa (ganho de material da jogada menos o
+    da resposta, +100/-100 por dar/levar mate), done e a máscara das jogadas
+    legais em next_state. As jogadas sem resposta
+    num jogo que não acabou pelas regras (desistência, tempo) são descartadas.
+    """
+    env = env or ChessEnv()
+    env.set_board(game.board())
+    board = env.board
+
+    states, masks, actions, gains, terminal = [], [], [], [], []
+    for move in game.mainline_moves():
+        flip = 63 if board.turn == chess.BLACK else 0
+        states.append(encode_board(board))
+        masks.append(np.packbits(legal_mask(legal_actions(board))))
+        actions.append((move.from_square ^ flip) * 64 + (move.to_square ^ flip))
+        gain = env._material_gain(move)
+        board.push(move)
+        over = board.is_game_over()
+        if over and board.is_checkmate():
+            gain += 100
+        gains.append(gain)
+        terminal.append(over)
+        if over:
+            break
+    states.append(encode_board(board))
+    masks.append(np.packbits(legal_mask(legal_actions(board))))
+
+    n = len(actions)
+    out = np.zeros(n, dtype=TRANSITION_DTYPE)
+    keep = np.zeros(n, dtype=np.bool_)
+    for t in range(n):
+        if terminal[t]:
+            # A jogada acabou o jogo: o next_state é ignorado no alvo
+            out[t] = (states[t], states[t + 1], actions[t], gains[t], True, masks[t + 1])
+        elif t + 1 < n:
+            out[t] = (states[t], states[t + 2], actions[t], gains[t] - gains[t + 1], terminal[t + 1],
+                      masks[t + 2])
+        else:
+            continue
+        keep[t] = True
+    return out[keep]
+
+def parse_chunk(text):
+    """Parse de um bloco de jogos (corre nos processos de trabalho)"""
+    env = ChessEnv()
+    stream = io.StringIO(text)
+    parts = []
+    games = 0
+    while True:
+        game = chess.pgn.read_game(stream)
+        if game is None:
+            break
+        if game.errors:
+            continue
+        parts.append(game_transitions(game, env))
+        games += 1
+    transitions = np.concatenate(parts) if parts else np.zeros(0, dtype=TRANSITION_DTYPE)
+    return games, transitions
+
+class ShardWriter:
+    """
+    Escreve transições em shards de tamanho fixo (shard_00000.npy, ...), em
+    arrays estruturados que o ShardLoader abre com memory-map. Só o shard
+    em construção está em memória.
+    """
+    def __init__(self, out_dir, shard_size=262_144):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self._buffer = np.zeros(shard_size, dtype=TRANSITION_DTYPE)
+        self._fill = 0
+        self.shards = 0
+        self.transitions = 0
+
+    def write(self, transitions):
+        while len(transitions):
+            n = min(len(transitions), self.shard_size - self._fill)
+            self._buffer[self._fill:self._fill + n] = transitions[:n]
+            self._fill += n
+            transitions = transitions[n:]
+            if self._fill == self.shard_size:
+                self._flush()
+
+    def _flush(self):
+        if self._fill == 0:
+            return
+        path = os.path.join(self.out_dir, f"shard_{self.shards:05d}.npy")
+        np.save(path + ".tmp.npy", self._buffer[:self._fill])
+        os.replace(path + ".tmp.npy", path)
+        self.shards += 1
+        self.transitions += self._fill
+        self._fill = 0
+
+    def close(self):
+        self._flush()
+
+def build_shards(paths, out_dir, workers=None, shard_size=262_144, games_per_chunk=256):
+    """
+    Converte ficheiros PGN (também .gz/.bz2) em shards de transições. O parse
+    é feito em paralelo por `workers` processos, com no máximo 2 blocos
+    pendentes por processo: a memória não cresce com o tamanho do input.
+    """
+    workers = workers or os.cpu_count()
+    writer = ShardWriter(out_dir, shard_size)
+    games = 0
+    start = time.perf_counter()
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(workers) as pool:
+        pending = deque()
+
+        def collect():
+            nonlocal games
+            chunk_games, transitions = pending.popleft().get()
+            games += chunk_games
+            writer.write(transitions)
+
+        for text in iter_game_chunks(paths, games_per_chunk):
+            pending.append(pool.apply_async(parse_chunk, (text,)))
+            if len(pending) >= 2 * workers:
+                collect()
+        while pending:
+            collect()
+    writer.close()
+    seconds = time.perf_counter() - start
+    print(f"{games} jogos -> {writer.transitions} transições em {writer.shards} shards "
+          f"({games / seconds:.0f} jogos/s, {workers} processos)")
+    return writer.transitions
+
+class ShardLoader:
+    """
+    Fonte de lotes a partir dos shards, com a mesma interface que a memória
+    de repetição (sample e len), para ser usada como DQNAgent.memory.
+    Uma thread em segundo plano sorteia transições de todos os shards
+    (abertos com memory-map) e prepara até `prefetch` lotes de tensores
+    enquanto a rede treina.
+    """
+    def __init__(self, shard_dir, batch_size=64, device="cpu", prefetch=4, seed=None):
+        paths = sorted(os.path.join(shard_dir, f) for f in os.listdir(shard_dir)
+                       if f.startswith("shard_") and f.endswith(".npy") and ".tmp" not in f)
+        if not paths:
+            raise FileNotFoundError(f"Nenhum shard em '{shard_dir}'")
+        self.shards = [np.load(p, mmap_mode="r") for p in paths]
+        if any(shard.dtype != TRANSITION_DTYPE for shard in self.shards):
+            # Sem as máscaras o max do alvo voltaria a contar jogadas ilegais
+            raise ValueError(f"Shards em '{shard_dir}' num formato antigo (sem máscaras): "
+                             "voltar a gerá-los com 'offline.py build'")
+        self.offsets = np.cumsum([0] + [len(s) for s in self.shards])
+        self.batch_size = batch_size
+        self.device = torch.device(device)
+        self.pin_memory = self.device.type == "cuda"
+        self._rng = np.random.default_rng(seed)
+        self._batches = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _gather(self, n):
+        # Índices ordenados: cada shard é lido por ordem crescente (acessos ao disco mais locais)
+        idx = np.sort(self._rng.integers(0, self.offsets[-1], size=n))
+        shard_ids = np.searchsorted(self.offsets, idx, side="right") - 1
+        records = np.empty(n, dtype=TRANSITION_DTYPE)
+        for s in np.unique(shard_ids):
+            rows = shard_ids == s
+            records[rows] = self.shards[s][idx[rows] - self.offsets[s]]
+        return records
+
+    def _to_tensor(self, array):
+        tensor = torch.from_numpy(np.ascontiguousarray(array))
+        if self.pin_memory:
+            tensor = tensor.pin_memory()
+        return tensor.to(self.device, non_blocking=self.pin_memory)
+
+    def _make_batch(self, n):
+        records = self._gather(n)
+        return Batch(self._to_tensor(unpack_planes(records["state"])).float(),
+                     self._to_tensor(records["action"]).long(),
+                     self._to_tensor(records["reward"]),
+                     self._to_tensor(unpack_planes(records["next_state"])).float(),
+                     self._to_tensor(records["done"]).float(),
+                     self._to_tensor(np.unpackbits(records["next_mask"], axis=1)).bool())
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._make_batch(self.batch_size)
+            while not self._stop.is_set():
+                try:
+                    self._batches.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def sample(self, batch_size):
+        if batch_size != self.batch_size:
+            return self._make_batch(batch_size)
+        return self._batches.get()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+def pretrain(shard_dir, steps=10_000, batch_size=256, prefetch=4, target_update_steps=1000,
+             save_path="chess_dqn.pth", checkpoint_every=None, report_every=500):
+    """Treina o DQNAgent só com os shards (sem jogos ao vivo) e grava os pesos"""
+    from agent import DQNAgent
+    from checkpoint import CheckpointWriter
+    from model import save_checkpoint
+
+    agent = DQNAgent(device="cuda" if torch.cuda.is_available() else "cpu", memory_size=1,
+                     batch_size=batch_size, target_update_steps=target_update_steps)
+    agent.memory = ShardLoader(shard_dir, batch_size, agent.device, prefetch)
+    print(f"Pré-treino com {len(agent.memory)} transições em {len(agent.memory.shards)} shards ({agent.device})")
+    writer = CheckpointWriter(save_path) if checkpoint_every and save_path else None
+
+    start = time.perf_counter()
+    for step in range(1, steps + 1):
+        loss = agent.optimize_model()
+        if writer is not None and step % checkpoint_every == 0:
+            writer.save(agent.policy_net)
+        if step % report_every == 0:
+            rate = step * batch_size / (time.perf_counter() - start)
+            print(f"Passo {step}: perda={loss:.4f}, {rate:.0f} amostras/s")
+
+    agent.memory.close()
+    if writer is not None:
+        writer.close()
+    if save_path:
+        save_checkpoint(agent.policy_net, save_path)
+        print(f"Pré-treino concluído. Modelo guardado em '{save_path}'.")
+    return agent
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pré-treino offline a partir de jogos em PGN")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Converter ficheiros PGN em shards de transições")
+    build.add_argument("pgn", nargs="+", help="Ficheiros .pgn (ou .pgn.gz / .pgn.bz2)")
+    build.add_argument("--out", default="shards")
+    build.add_argument("--workers", type=int, default=None, help="Processos de parse (por omissão, um por CPU)")
+    build.add_argument("--shard-size", type=int, default=262_144, help="Transições por shard")
+    build.add_argument("--games-per-chunk", type=int, default=256)
+    train = sub.add_parser("train", help="Treinar o DQNAgent a partir dos shards")
+    train.add_argument("shards", nargs="?", default="shards")
+    train.add_argument("--steps", type=int, default=10_000)
+    train.add_argument("--batch-size", type=int, default=256)
+    train.add_argument("--prefetch", type=int, default=4, help="Lotes preparados em segundo plano")
+    train.add_argument("--target-update-steps", type=int, default=1000)
+    train.add_argument("--checkpoint-every", type=int, default=None)
+    train.add_argument("--save", default="chess_dqn.pth")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_shards(args.pgn, args.out, args.workers, args.shard_size, args.games_per_chunk)
+    else:
+        pretrain(args.shards, args.steps, args.batch_size, args.prefetch, args.target_update_steps,
+                 args.save, args.checkpoint_every)
@@ -1,16 +1,49 @@
-import torch
+import argparse
 from env import ChessEnv
 from agent import DQNAgent
+from model import load_checkpoint
+from inference import InferenceAgent, InferenceServer
+from search import MCTS
 
-def play_game():
-    env = ChessEnv()
-    agent = DQNAgent(device="cpu")
-    
-    try:
-        agent.policy_net.load_state_dict(torch.load("chess_dqn.pth", map_location="cpu"))
-        print("Modelo treinado carregado com sucesso.")
-    except Exception as e:
-        print("Modelo 'chess_dqn.pth' não encontrado. O agente vai jogar com pesos aleatórios (não treinado).")
+def play_game(batched=False, max_batch=64, max_wait_ms=2.0, quantized=None,
+              search_nodes=None, search_time=None, search_batch=16):
+    if quantized:
+        # Modelo int8 exportado pelo export.py: não é preciso o DQNAgent de treino
+        agent = InferenceAgent(quantized)
+        print(f"Modelo quantizado '{quantized}' carregado com sucesso.")
+        batched = False
+    else:
+        # Só a falta do ficheiro leva aos pesos aleatórios: um checkpoint que
+        # não carrega (cabeça ou pesos errados) é um erro
+        try:
+            head, state_dict = load_checkpoint("chess_dqn.pth")
+        except FileNotFoundError:
+            head, state_dict = "dense", None
+            print("Modelo 'chess_dqn.pth' não encontrado. O agente vai jogar com pesos aleatórios (não treinado).")
+        # Cache por posição: aberturas, repetições e transposições não voltam a passar pela rede
+        agent = DQNAgent(device="cpu", cache_size=50_000, head=head)
+        if state_dict is not None:
+            agent.policy_net.load_state_dict(state_dict)
+            print(f"Modelo treinado carregado com sucesso (cabeça {head}).")
+    # As ações do ambiente têm de estar na codificação da cabeça da rede
+    env = ChessEnv(agent.promotions)
+
+    # Procura em árvore sobre a rede (com orçamento de nós ou de tempo por jogada)
+    search = None
+    if search_nodes or search_time:
+        net = agent.net if quantized else agent.policy_net
+        net.eval()
+        search = MCTS(net, "cpu", batch_size=search_batch, cache=getattr(agent, "cache", None),
+                      promotions=agent.promotions)
+        batched = False
+
+    server = None
+    if batched:
+        # As jogadas do agente passam pelo serviço de inferência em lote
+        # (o mesmo usado pelos atores de treino), que tem a mesma interface
+        agent.policy_net.eval()
+        server = InferenceServer(agent.policy_net, "cpu", max_batch, max_wait_ms).start()
+        agent = server
         
     state, legal_actions = env.reset()
     done = False
@@ -32,7 +65,7 @@ def play_game():
         
         if user_turn:
             print("\nA tua vez!")
-            valid_moves = [m.uci() for _, m in legal_actions]
+            valid_moves = [m.uci() for m in legal_actions.values()]
             print(f"Algumas jogadas legais: {valid_moves[:5]} ... (total {len(valid_moves)})")
             
             valid = False
@@ -40,7 +73,7 @@ def play_game():
                 move_uci = input("Insere a tua jogada (formato e2e4): ")
                 
                 action = None
-                for idx, m in legal_actions:
+                for idx, m in legal_actions.items():
                     if m.uci() == move_uci:
                         action = idx
                         valid = True
@@ -55,13 +88,15 @@ def play_game():
             
         else:
             print("\nO Agente está a pensar...")
-            action = agent.select_action(state, legal_actions, epsilon=0.0)
+            if search is not None:
+                action, _ = search.search(env.board, max_nodes=search_nodes, max_time=search_time)
+                stats = search.stats()
+                print(f"Procura: {stats['nodes']} nós, {stats['nodes_per_s']:.0f} nós/s, lotes={stats['batch_sizes']}")
+            else:
+                action = agent.select_action(state, legal_actions, epsilon=0.0, legal_mask=env.get_legal_mask(),
+                                             position_key=env.position_key())
             
-            chosen_m = None
-            for idx, m in legal_actions:
-                if idx == action:
-                    chosen_m = m
-                    break
+            chosen_m = legal_actions.get(action)
                     
             if chosen_m:
                 print(f"O Agente jogou: {chosen_m.uci()}")
@@ -78,5 +113,26 @@ def play_game():
     print("Fim do Jogo!")
     print("Resultado Final:", env.board.result())
 
+    if getattr(agent, "cache", None) is not None:
+        print("Cache de posições:", agent.cache.stats())
+
+    if server is not None:
+        server.stop()
+        stats = server.stats()
+        print(f"Inferência: p50={stats['p50_ms']:.2f} ms p99={stats['p99_ms']:.2f} ms lotes={stats['batch_sizes']}")
+
 if __name__ == "__main__":
-    play_game()
+    parser = argparse.ArgumentParser(description="Jogar contra o agente DQN")
+    parser.add_argument("--batched", action="store_true", help="Usar o serviço de inferência em lote")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--quantized", nargs="?", const="chess_dqn_int8.pt", default=None,
+                        help="Jogar com o modelo int8 gerado pelo export.py")
+    parser.add_argument("--search-nodes", type=int, default=None,
+                        help="Escolher as jogadas com MCTS, com este número de nós por jogada")
+    parser.add_argument("--search-time", type=float, default=None,
+                        help="Escolher as jogadas com MCTS, com este tempo (segundos) por jogada")
+    parser.add_argument("--search-batch", type=int, default=16, help="Folhas avaliadas por forward pass na procura")
+    args = parser.parse_args()
+    play_game(args.batched, args.max_batch, args.max_wait_ms, args.quantized,
+              args.search_nodes, args.search_time, args.search_batch)
@@ -0,0 +1,147 @@
+import cProfile
+import csv
+import io
+import json
+import pstats
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+import torch
+
+_NULL_SPAN = nullcontext()
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter_ns() - self.start
+        self.profiler.span_ns[self.name] += elapsed
+        self.profiler.span_calls[self.name] += 1
+        return False
+
+class Profiler:
+    """
+    Medição leve das fases do treino: spans (tempo acumulado e número de
+    chamadas por nome) e contadores (somas e número de amostras por nome).
+    Desligado, span() devolve sempre o mesmo contexto vazio e count() não
+    faz nada, por isso as medições podem ficar no código dos caminhos quentes.
+    Os spans podem estar aninhados (env.step inclui env.movegen), por isso os
+    tempos não se somam. Em GPU as operações são assíncronas: o tempo aparece
+    na fase que sincroniza (por exemplo, o .item() da perda).
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.span_ns = defaultdict(int)
+        self.span_calls = defaultdict(int)
+        self.counters = defaultdict(float)
+        self.counter_samples = defaultdict(int)
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] += value
+            self.counter_samples[name] += 1
+
+    def snapshot(self, reset=True):
+        """
+        Resumo desde o último snapshot: ms totais e chamadas por span, e soma
+        e média de cada contador.
+        """
+        summary = {}
+        for name, ns in self.span_ns.items():
+            summary[f"{name}_ms"] = ns / 1e6
+            summary[f"{name}_calls"] = self.span_calls[name]
+        for name, total in self.counters.items():
+            summary[f"{name}_sum"] = total
+            summary[f"{name}_mean"] = total / self.counter_samples[name]
+        if reset:
+            self.reset()
+        return summary
+
+# Instância global usada pelo env.py, agent.py e train.py (desligada por omissão)
+profiler = Profiler()
+
+class MetricsLogger:
+    """
+    Exporta linhas de métricas para CSV ou JSONL (pela extensão do ficheiro).
+    No CSV as colunas são fixadas pela primeira linha; chaves novas que
+    apareçam depois (um span que ainda não tinha corrido) são ignoradas.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.jsonl = path.endswith(".jsonl")
+        self._file = open(path, "w", newline="")
+        self._writer = None
+
+    def write(self, row):
+        if self.jsonl:
+            self._file.write(json.dumps(row) + "\n")
+        else:
+            if self._writer is None:
+                self._writer = csv.DictWriter(self._file, fieldnames=list(row), extrasaction="ignore")
+                self._writer.writeheader()
+            self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class TraceWindow:
+    """
+    Captura um perfil (cProfile ou torch.profiler) durante `steps` passos,
+    a partir do passo `start`, e grava-o em `path` (.prof para o cProfile,
+    trace Chrome .json para o torch.profiler). Chamar step() uma vez por
+    passo do ciclo de treino.
+    """
+    def __init__(self, kind="cprofile", start=100, steps=50, path=None):
+        self.kind = kind
+        self.start = start
+        self.steps = steps
+        self.path = path or ("profile.prof" if kind == "cprofile" else "trace.json")
+        self._step = 0
+        self._active = None
+
+    def step(self):
+        self._step += 1
+        if self._step == self.start:
+            if self.kind == "cprofile":
+                self._active = cProfile.Profile()
+                self._active.enable()
+            else:
+                self._active = torch.profiler.profile(
+                    activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+                self._active.__enter__()
+        elif self._active is not None and self._step == self.start + self.steps:
+            self.stop()
+
+    def stop(self):
+        if self._active is None:
+            return
+        if self.kind == "cprofile":
+            self._active.disable()
+            self._active.dump_stats(self.path)
+            out = io.StringIO()
+            pstats.Stats(self._active, stream=out).sort_stats("cumulative").print_stats(15)
+            print(out.getvalue())
+        else:
+            self._active.__exit__(None, None, None)
+            self._active.export_chrome_trace(self.path)
+            print(self._active.key_averages().table(sort_by="self_cpu_time_total", row_limit=15))
+        print(f"Perfil de {self.steps} passos gravado em '{self.path}'.")
+        self._active = None
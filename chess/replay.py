@@ -0,0 +1,318 @@
+import numpy as np
+import torch
+from collections import namedtuple
+from env import NUM_ACTIONS, pack_planes, unpack_planes
+
+# Lote de transições já convertido em tensores prontos a usar pela rede.
+# next_masks (jogadas legais em next_state) é None se o buffer não as guardar.
+# weights e indices só existem na memória com prioridades (pesos de importance
+# sampling e posições a atualizar com os novos erros TD).
+Batch = namedtuple("Batch", ["states", "actions", "rewards", "next_states", "dones", "next_masks",
+                             "weights", "indices"], defaults=(None, None))
+
+def _pack_mask(mask):
+    # Sem máscara, todas as ações contam para o max do alvo (comportamento original)
+    if mask is None:
+        return 0xFF
+    return np.packbits(mask)
+
+class ReplayBuffer:
+    """
+    Memória de repetição com capacidade fixa, guardada em arrays NumPy
+    pré-alocados e contíguos (buffer circular).
+    Os estados 12 x 8 x 8 são binários, por isso são guardados em uint8
+    e só convertidos para float32 no momento da amostragem, já em lote.
+    num_actions é o tamanho das máscaras de jogadas legais (NUM_ACTIONS, ou
+    NUM_PROMOTION_ACTIONS com a codificação com promoções).
+    """
+    def __init__(self, capacity, device="cpu", pin_memory=False, num_actions=NUM_ACTIONS):
+        self.capacity = capacity
+        self.device = torch.device(device)
+        # Memória "pinned" só faz sentido quando a cópia final é para a GPU
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+
+        self.states = np.zeros((capacity, 12, 8, 8), dtype=np.uint8)
+        self.next_states = np.zeros((capacity, 12, 8, 8), dtype=np.uint8)
+        self.actions = np.zeros(capacity, dtype=np.int16)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.bool_)
+        # Máscaras das jogadas legais em next_state, compactadas em bits (512 bytes)
+        self.next_masks = np.zeros((capacity, num_actions // 8), dtype=np.uint8)
+
+        self.position = 0 # Próxima posição a escrever
+        self.size = 0
+
+    def push(self, state, action, reward, next_state, done, next_mask=None):
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.next_masks[i] = _pack_mask(next_mask)
+
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def push_batch(self, states, actions, rewards, next_states, dones, next_masks=None):
+        """Insere várias transições de uma vez (arrays com a mesma primeira dimensão)"""
+        n = len(actions)
+        idx = (self.position + np.arange(n)) % self.capacity
+        self.states[idx] = states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = next_states
+        self.dones[idx] = dones
+        self.next_masks[idx] = 0xFF if next_masks is None else np.packbits(next_masks, axis=1)
+
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def sample(self, batch_size):
+        # Amostragem uniforme com reposição, feita de uma só vez para todo o lote
+        idx = np.random.randint(0, self.size, size=batch_size)
+        return self._to_batch(idx)
+
+    def _to_batch(self, idx):
+        states = self._to_tensor(self.states[idx]).float()
+        next_states = self._to_tensor(self.next_states[idx]).float()
+        actions = self._to_tensor(self.actions[idx]).long()
+        rewards = self._to_tensor(self.rewards[idx])
+        dones = self._to_tensor(self.dones[idx]).float()
+        next_masks = self._to_tensor(np.unpackbits(self.next_masks[idx], axis=1)).bool()
+        return Batch(states, actions, rewards, next_states, dones, next_masks)
+
+    def _to_tensor(self, array):
+        tensor = torch.from_numpy(array)
+        if self.pin_memory:
+            tensor = tensor.pin_memory()
+        return tensor.to(self.device, non_blocking=self.pin_memory)
+
+    @property
+    def nbytes(self):
+        """Memória ocupada pelos arrays do buffer, em bytes"""
+        return sum(a.nbytes for a in (self.states, self.next_states, self.actions, self.rewards,
+                                      self.dones, self.next_masks))
+
+    def __len__(self):
+        return self.size
+
+class CompactReplayBuffer(ReplayBuffer):
+    """
+    Versão compacta da memória de repetição, para milhões de transições.
+    Cada estado é guardado como 12 bitboards de 64 bits (96 bytes) numa
+    tabela de "frames". As transições apenas referenciam os frames por
+    índice: como o next_state de uma jogada é o state da seguinte, cada
+    posição é guardada uma única vez. Os frames só são expandidos para
+    planos 12 x 8 x 8 no momento da amostragem, já em lote.
+    As máscaras de jogadas legais (512 bytes por frame) só são guardadas com
+    store_masks=True, porque custam mais do que o próprio tabuleiro.
+    """
+    def __init__(self, capacity, device="cpu", pin_memory=False, frame_capacity=None, store_masks=False,
+                 num_actions=NUM_ACTIONS):
+        self.capacity = capacity
+        self.device = torch.device(device)
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+
+        # Com um único jogo em curso cada transição gasta exatamente um frame
+        # (o next_state de uma transição terminal não é guardado). A folga
+        # cobre vários jogos intercalados no mesmo buffer.
+        if frame_capacity is None:
+            frame_capacity = capacity + max(64, capacity // 64)
+        self.frame_capacity = frame_capacity
+        self.frames = np.zeros((frame_capacity, 12), dtype="<u8")
+        self.frame_masks = np.zeros((frame_capacity if store_masks else 0, num_actions // 8), dtype=np.uint8)
+        self.store_masks = store_masks
+        self.frames_written = 0
+
+        # Referências absolutas (nunca dão a volta) para detetar frames já reescritos
+        self.state_refs = np.zeros(capacity, dtype=np.int64)
+        self.next_refs = np.zeros(capacity, dtype=np.int64)
+        self.actions = np.zeros(capacity, dtype=np.int16)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.bool_)
+
+        self.head = 0 # Número total de transições inseridas
+        self.tail = 0 # Transição válida mais antiga
+        # next_states ainda à espera de serem o state da transição seguinte
+        self._pending = {}
+
+    def _write_frame(self, packed, mask=None):
+        ref = self.frames_written
+        self.frames[ref % self.frame_capacity] = packed
+        if self.store_masks:
+            self.frame_masks[ref % self.frame_capacity] = _pack_mask(mask)
+        self.frames_written += 1
+        return ref
+
+    def _oldest_frame(self):
+        return self.frames_written - self.frame_capacity
+
+    def push(self, state, action, reward, next_state, done, next_mask=None):
+        packed = pack_planes(state)
+        key = packed.tobytes()
+        state_ref = self._pending.pop(key, None)
+        if state_ref is None or state_ref < self._oldest_frame():
+            # A máscara de um state nunca é usada no alvo
+            state_ref = self._write_frame(packed)
+
+        if done:
+            # O valor do next_state terminal é anulado por (1 - done) no alvo
+            next_ref = state_ref
+        else:
+            next_packed = pack_planes(next_state)
+            next_ref = self._write_frame(next_packed, next_mask)
+            self._pending[next_packed.tobytes()] = next_ref
+            if len(self._pending) > 1024:
+                # Jogos abandonados a meio não devem acumular entradas
+                del self._pending[next(iter(self._pending))]
+
+        i = self.head % self.capacity
+        self.state_refs[i] = state_ref
+        self.next_refs[i] = next_ref
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.dones[i] = done
+        self.head += 1
+
+        # Descartar transições que saíram do buffer ou cujos frames foram reescritos
+        self.tail = max(self.tail, self.head - self.capacity)
+        oldest = self._oldest_frame()
+        while self.tail < self.head and not self._valid(self.tail % self.capacity, oldest):
+            self.tail += 1
+
+    def push_batch(self, states, actions, rewards, next_states, dones, next_masks=None):
+        # A partilha de frames depende da ordem das transições, por isso uma a uma
+        for i in range(len(actions)):
+            self.push(states[i], actions[i], rewards[i], next_states[i], dones[i],
+                      None if next_masks is None else next_masks[i])
+
+    def _valid(self, i, oldest):
+        return min(self.state_refs[i], self.next_refs[i]) >= oldest
+
+    def sample(self, batch_size):
+        idx = (self.tail + np.random.randint(0, len(self), size=batch_size)) % self.capacity
+        # Com jogos intercalados, algumas transições recentes podem apontar para
+        # frames antigos já reescritos: voltar a sortear apenas essas
+        oldest = self._oldest_frame()
+        invalid = np.minimum(self.state_refs[idx], self.next_refs[idx]) < oldest
+        while invalid.any():
+            idx[invalid] = (self.tail + np.random.randint(0, len(self), size=invalid.sum())) % self.capacity
+            invalid = np.minimum(self.state_refs[idx], self.next_refs[idx]) < oldest
+        return self._to_batch(idx)
+
+    def _to_batch(self, idx):
+        states = self._to_tensor(unpack_planes(self.frames[self.state_refs[idx] % self.frame_capacity])).float()
+        next_states = self._to_tensor(unpack_planes(self.frames[self.next_refs[idx] % self.frame_capacity])).float()
+        actions = self._to_tensor(self.actions[idx]).long()
+        rewards = self._to_tensor(self.rewards[idx])
+        dones = self._to_tensor(self.dones[idx]).float()
+        next_masks = None
+        if self.store_masks:
+            packed_masks = self.frame_masks[self.next_refs[idx] % self.frame_capacity]
+            next_masks = self._to_tensor(np.unpackbits(packed_masks, axis=1)).bool()
+        return Batch(states, actions, rewards, next_states, dones, next_masks)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.frames, self.frame_masks, self.state_refs, self.next_refs,
+                                      self.actions, self.rewards, self.dones))
+
+    def __len__(self):
+        return self.head - self.tail
+
+class SumTree:
+    """
+    Árvore de somas guardada num array NumPy (heap implícito: os filhos do nó
+    i são 2i e 2i+1, as folhas ocupam a segunda metade). Cada folha é a
+    prioridade de uma posição do buffer e cada nó interno a soma dos filhos,
+    por isso amostrar e atualizar custam O(log n), feito para o lote inteiro
+    de uma vez (um passo vetorizado por nível da árvore).
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.depth = max(1, int(np.ceil(np.log2(capacity))))
+        self.leaves = 1 << self.depth
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def __getitem__(self, idx):
+        return self.tree[self.leaves + np.asarray(idx)]
+
+    def update(self, idx, priorities):
+        nodes = self.leaves + np.asarray(idx, dtype=np.int64)
+        self.tree[nodes] = priorities
+        # Recalcular os pais a partir dos filhos: índices repetidos escrevem o
+        # mesmo valor, por isso não é preciso np.unique
+        for _ in range(self.depth):
+            nodes >>= 1
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """Folha onde cai cada valor da soma acumulada (values em [0, total))"""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.leaves
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Memória de repetição com prioridades (Schaul et al., 2016): cada transição
+    é sorteada com probabilidade proporcional a (|erro TD| + eps)^alpha, e o
+    lote traz os pesos de importance sampling (N * P(i))^-beta que corrigem o
+    enviesamento na perda. beta sobe linearmente até 1 ao longo de
+    beta_steps amostragens. As transições novas entram com a prioridade máxima
+    já vista, para serem treinadas pelo menos uma vez.
+    """
+    def __init__(self, capacity, device="cpu", pin_memory=False, alpha=0.6, beta=0.4,
+                 beta_steps=100_000, eps=1e-3, num_actions=NUM_ACTIONS):
+        super().__init__(capacity, device, pin_memory, num_actions)
+        self.tree = SumTree(capacity)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = (1.0 - beta) / beta_steps
+        self.eps = eps
+        self.max_priority = 1.0
+
+    def push(self, state, action, reward, next_state, done, next_mask=None):
+        i = self.position
+        super().push(state, action, reward, next_state, done, next_mask)
+        self.tree.update([i], self.max_priority ** self.alpha)
+
+    def push_batch(self, states, actions, rewards, next_states, dones, next_masks=None):
+        idx = (self.position + np.arange(len(actions))) % self.capacity
+        super().push_batch(states, actions, rewards, next_states, dones, next_masks)
+        self.tree.update(idx, self.max_priority ** self.alpha)
+
+    def sample(self, batch_size):
+        # Amostragem estratificada: um valor ao acaso em cada uma de batch_size fatias da soma
+        total = self.tree.total
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * (total / batch_size)
+        # Erros de arredondamento podem cair para lá da última transição
+        idx = np.minimum(self.tree.find(values), self.size - 1)
+
+        probs = self.tree[idx] / total
+        weights = (self.size * probs) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        batch = self._to_batch(idx)
+        return batch._replace(weights=self._to_tensor(weights.astype(np.float32)), indices=idx)
+
+    def update_priorities(self, indices, td_errors):
+        """Novas prioridades a partir dos erros TD (array NumPy) das transições amostradas"""
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(indices, priorities ** self.alpha)
+
+    @property
+    def nbytes(self):
+        return super().nbytes + self.tree.tree.nbytes
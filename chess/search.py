@@ -0,0 +1,207 @@
+import math
+import time
+from collections import Counter
+
+import numpy as np
+import torch
+
+from cache import position_key
+from env import encode_boards, legal_actions
+
+class Node:
+    """Nó da árvore MCTS. W é a soma dos valores na perspetiva de quem jogou para aqui."""
+    __slots__ = ("prior", "visits", "value_sum", "children", "terminal_value")
+
+    def __init__(self, prior):
+        self.prior = prior
+        self.visits = 0
+        self.value_sum = 0.0
+        self.children = None # {action_idx: (move, Node)}, None enquanto não expandido
+        self.terminal_value = None
+
+    def q(self):
+        return self.value_sum / self.visits if self.visits else 0.0
+
+class MCTS:
+    """
+    Procura em árvore (MCTS com PUCT) sobre a ChessDQN: os Q-values das jogadas
+    legais dão as probabilidades a priori (softmax) e o valor das folhas
+    (o melhor Q, comprimido para [-1, 1] com tanh). As folhas são juntadas em
+    lotes de até batch_size (com "virtual loss" para os caminhos divergirem) e
+    avaliadas numa só forward pass. A subárvore da jogada feita é reaproveitada
+    na procura seguinte. A codificação das jogadas (com ou sem sub-promoções)
+    vem da cabeça da rede, ou de `promotions` para redes sem ela (TorchScript).
+    """
+    def __init__(self, net, device="cpu", batch_size=16, c_puct=1.5, value_scale=10.0,
+                 temperature=1.0, cache=None, version=0, promotions=None):
+        self.net = net
+        self.promotions = getattr(net, "head", "dense") == "compact" if promotions is None else promotions
+        self.device = torch.device(device)
+        self.batch_size = batch_size
+        self.c_puct = c_puct
+        # Q-values estão em unidades de material (o mate vale 100)
+        self.value_scale = value_scale
+        self.temperature = temperature
+        self.cache = cache
+        self.version = version
+
+        self.root = None
+        self.root_stack = None # Jogadas desde o início até à raiz atual
+        self.root_board = None
+
+        # Estatísticas da última procura
+        self.batch_sizes = Counter()
+        self.nodes = 0
+        self.seconds = 0.0
+
+    def _evaluate(self, boards):
+        """(priors por ação, valor para quem joga) de cada tabuleiro, numa só forward pass"""
+        results = [None] * len(boards)
+        pending = []
+        for i, board in enumerate(boards):
+            actions = legal_actions(board, self.promotions)
+            key = position_key(board) if self.cache is not None else None
+            cached = self.cache.get(key, self.version) if key is not None else None
+            if cached is not None:
+                results[i] = (actions, cached)
+            else:
+                pending.append((i, actions, key))
+
+        if pending:
+            states = encode_boards([boards[i] for i, _, _ in pending])
+            with torch.no_grad():
+                q_all = self.net(torch.from_numpy(states).to(self.device)).float().cpu().numpy()
+            for row, (i, actions, key) in enumerate(pending):
+                # Índices por ordem crescente, como as entradas de DQNAgent.legal_q_values
+                idx = np.sort(np.fromiter(actions, dtype=np.int64, count=len(actions)))
+                entry = (idx, q_all[row, idx])
+                if key is not None:
+                    self.cache.put(key, self.version, entry)
+                results[i] = (actions, entry)
+            self.batch_sizes[len(pending)] += 1
+        return results
+
+    def _expand(self, node, actions, entry):
+        idx, q_values = entry
+        logits = q_values / self.temperature
+        priors = np.exp(logits - logits.max())
+        priors /= priors.sum()
+        node.children = {int(a): (actions[int(a)], Node(float(p))) for a, p in zip(idx, priors)}
+        return math.tanh(float(q_values.max()) / self.value_scale)
+
+    def _terminal_value(self, board):
+        """Valor para quem joga numa posição terminal, ou None se o jogo continua"""
+        if board.is_checkmate():
+            return -1.0
+        if board.is_game_over():
+            return 0.0
+        return None
+
+    def _select_child(self, node):
+        sqrt_visits = math.sqrt(node.visits + 1)
+        best, best_score = None, -float('inf')
+        for action, (move, child) in node.children.items():
+            score = child.q() + self.c_puct * child.prior * sqrt_visits / (1 + child.visits)
+            if score > best_score:
+                best, best_score = (move, child), score
+        return best
+
+    @staticmethod
+    def _backup(path, value):
+        # value é para quem joga na folha; cada nó guarda o valor de quem jogou para ele
+        for node in reversed(path):
+            value = -value
+            node.visits += 1
+            node.value_sum += value
+
+    def _set_root(self, board):
+        """Reaproveita a subárvore se `board` vier da raiz anterior por jogadas já exploradas"""
+        stack = board.move_stack
+        if self.root is not None and stack[:len(self.root_stack)] == self.root_stack:
+            node = self.root
+            for move in stack[len(self.root_stack):]:
+                if node.children is None:
+                    node = None
+                    break
+                child = next((c for m, c in node.children.values() if m == move), None)
+                if child is None:
+                    node = None
+                    break
+                node = child
+            if node is not None:
+                self.root = node
+                self.root_stack = list(stack)
+                self.root_board = board.copy()
+                return
+        self.root = Node(1.0)
+        self.root_stack = list(stack)
+        self.root_board = board.copy()
+
+    def search(self, board, max_nodes=800, max_time=None):
+        """
+        Procura a partir de `board` até max_nodes avaliações ou max_time
+        segundos. Devolve (action_idx, move) da jogada mais visitada.
+        """
+        self._set_root(board)
+        self.batch_sizes = Counter()
+        self.nodes = 0
+        start = time.perf_counter()
+        deadline = start + max_time if max_time is not None else None
+
+        if self.root.children is None:
+            ((actions, entry),) = self._evaluate([self.root_board])
+            if not actions:
+                return None, None
+            self._expand(self.root, actions, entry)
+            self.root.visits += 1
+            self.nodes += 1
+
+        while (max_nodes is None or self.nodes < max_nodes) and (deadline is None or time.perf_counter() < deadline):
+            leaves = []
+            for _ in range(self.batch_size):
+                node, path = self.root, [self.root]
+                leaf_board = self.root_board.copy(stack=False)
+                while node.children:
+                    move, node = self._select_child(node)
+                    leaf_board.push(move)
+                    path.append(node)
+
+                if node.terminal_value is None and node.children is None:
+                    node.terminal_value = self._terminal_value(leaf_board)
+                if node.terminal_value is not None:
+                    self._backup(path[1:], node.terminal_value)
+                    self.root.visits += 1
+                    self.nodes += 1
+                    continue
+                if any(node is other for other, _, _ in leaves):
+                    # Folha já pedida neste lote: parar de juntar
+                    break
+                # "Virtual loss": o caminho parece pior enquanto espera pela avaliação
+                for n in path[1:]:
+                    n.visits += 1
+                    n.value_sum -= 1.0
+                leaves.append((node, path, leaf_board))
+
+            if not leaves:
+                continue
+            evaluations = self._evaluate([b for _, _, b in leaves])
+            for (node, path, _), (actions, entry) in zip(leaves, evaluations):
+                for n in path[1:]:
+                    n.visits -= 1
+                    n.value_sum += 1.0
+                value = self._expand(node, actions, entry)
+                self._backup(path[1:], value)
+                self.root.visits += 1
+                self.nodes += 1
+
+        self.seconds = time.perf_counter() - start
+        action, (move, _) = max(self.root.children.items(), key=lambda item: item[1][1].visits)
+        return action, move
+
+    def stats(self):
+        return {
+            "nodes": self.nodes,
+            "nodes_per_s": self.nodes / self.seconds if self.seconds else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "root_visits": self.root.visits if self.root else 0,
+        }
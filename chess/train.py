@@ -1,73 +1,185 @@
-import torch
+import argparse
 import random
-from env import ChessEnv
+import time
+import numpy as np
+import torch
+from env import VectorChessEnv
 from agent import DQNAgent
+from checkpoint import CheckpointWriter
+from model import save_checkpoint
+from profiling import profiler, MetricsLogger, TraceWindow
+
+def train_agent(episodes=500, num_envs=1, train_every=1, gradient_steps=1, batch_size=64,
+                grad_accum_steps=1, target_tau=None, target_update_steps=None, checkpoint_every=None,
+                max_env_steps=None, save_path="chess_dqn.pth", amp_dtype=None, channels_last=False,
+                compile_model=False, prioritized=False, seed=None, device=None, log_path=None,
+                log_every=1000, profile=None, profile_start=100, profile_steps=50, head="dense"):
+    # Com uma semente, os pesos iniciais, a exploração e o oponente são reprodutíveis
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    agent = DQNAgent(device=device, batch_size=batch_size,
+                     grad_accum_steps=grad_accum_steps, target_tau=target_tau,
+                     target_update_steps=target_update_steps, amp_dtype=amp_dtype,
+                     channels_last=channels_last, compile_model=compile_model, prioritized=prioritized,
+                     head=head)
+    # Vários jogos em paralelo: a rede escolhe as jogadas de todos numa só forward pass.
+    # O oponente joga aleatoriamente para fins de treino inicial.
+    # A codificação das ações tem de ser a da cabeça da rede.
+    envs = VectorChessEnv(num_envs, seed=seed, promotions=agent.promotions)
+    print(f"A treinar usando o dispositivo: {agent.device} ({num_envs} jogos em paralelo)")
+
+    # Checkpoints periódicos gravados em segundo plano
+    writer = CheckpointWriter(save_path) if checkpoint_every and save_path else None
+    last_checkpoint = 0
 
-def train_agent(episodes=500):
-    env = ChessEnv()
-    agent = DQNAgent(device="cuda" if torch.cuda.is_available() else "cpu")
-    print(f"A treinar usando o dispositivo: {agent.device}")
-    
     # Parâmetros Epsilon-Greedy
     epsilon_start = 1.0
     epsilon_end = 0.1
     epsilon_decay = 0.995
     epsilon = epsilon_start
-    
-    for episode in range(episodes):
-        state, legal_actions = env.reset()
-        done = False
-        total_reward = 0
-        step = 0
-        
-        while not done:
-            # TURNO DO AGENTE
-            action = agent.select_action(state, legal_actions, epsilon)
-            
-            # Aplica a ação
-            next_state, reward_agent, done, info = env.step(action)
-            legal_actions = info["legal_actions"]
-            
-            if done:
-                reward = reward_agent
-                agent.store_transition(state, action, reward, next_state, done)
-                # Otimização final caso perca/ganhe nesse turno
-                agent.optimize_model()
-                break
-                
-            # TURNO DO OPONENTE (Joga aleatoriamente para fins de treino inicial)
-            opp_action = random.choice(legal_actions)[0]
-            next_state, reward_opp, done, info = env.step(opp_action)
-            legal_actions = info["legal_actions"]
-            
-            # A recompensa total da "maratona" dos dois turnos 
-            # (Vantagem material do Agente MENOS a vantagem alcançada pelo oponente)
-            reward = reward_agent - reward_opp
-            
-            # Armazena a transição do estado inicial do agente PARA o estado do agente
-            # após a resposta do oponente
-            agent.store_transition(state, action, reward, next_state, done)
-            
-            # Otimizar pesos da rede neural
-            loss = agent.optimize_model()
-            
-            state = next_state
-            total_reward += reward
-            step += 1
-            
-        # Atualizar a Rede Alvo a cada 10 episódios
-        if episode % 10 == 0:
-            agent.update_target_network()
-            
-        # Reduzir Epsilon (explorar menos, explorar o conhecimento mais)
-        epsilon = max(epsilon_end, epsilon * epsilon_decay)
-        
-        if episode % 10 == 0:
-            print(f"Episódio {episode}: Passos={step}, Recompensa Material={total_reward}, Epsilon={epsilon:.3f}")
-            
+
+    # Métricas por fase (spans e contadores) exportadas para CSV/JSONL a cada
+    # log_every passos de ambiente, e perfil opcional de uma janela de passos
+    logger = MetricsLogger(log_path) if log_path else None
+    profiler.enabled = logger is not None
+    profiler.reset()
+    trace = TraceWindow(profile, profile_start, profile_steps) if profile else None
+
+    states, masks = envs.reset()
+    episode = 0
+    env_steps = 0
+    loss = 0.0
+    start_time = time.perf_counter()
+    last_log = (start_time, 0, 0)
+
+    while episode < episodes and (max_env_steps is None or env_steps < max_env_steps):
+        if trace is not None:
+            trace.step()
+        # TURNO DO AGENTE (e resposta do oponente, dentro do VectorChessEnv)
+        with profiler.span("train.act"):
+            actions = agent.select_actions(states, masks, epsilon)
+        with profiler.span("env.step"):
+            next_states, rewards, dones, next_masks = envs.step(actions)
+
+        # Armazena a transição do estado inicial do agente PARA o estado do agente
+        # após a resposta do oponente, para cada um dos jogos
+        with profiler.span("replay.push"):
+            for i in range(num_envs):
+                agent.store_transition(states[i], actions[i], rewards[i], next_states[i], dones[i], next_masks[i])
+        env_steps += num_envs
+
+        # Otimizar pesos da rede neural: gradient_steps passos a cada train_every
+        # passos de ambiente (contados em jogadas, não em passos do conjunto de
+        # jogos, para a proporção entre atualizações e dados não depender de num_envs)
+        trainings = env_steps // train_every - (env_steps - num_envs) // train_every
+        if trainings:
+            with profiler.span("train.optimize"):
+                loss = agent.optimize_model(gradient_steps * trainings)
+
+        if logger is not None and env_steps - last_log[1] >= log_every:
+            now = time.perf_counter()
+            seconds = now - last_log[0]
+            logger.write({"env_steps": env_steps, "episodes": episode, "updates": agent.updates,
+                          "steps_per_s": (env_steps - last_log[1]) / seconds,
+                          "updates_per_s": (agent.updates - last_log[2]) / seconds,
+                          "replay_fill": len(agent.memory) / agent.memory.capacity,
+                          "loss": loss, "epsilon": epsilon, **profiler.snapshot()})
+            last_log = (now, env_steps, agent.updates)
+
+        if writer is not None and agent.updates - last_checkpoint >= checkpoint_every:
+            writer.save(agent.policy_net)
+            last_checkpoint = agent.updates
+
+        states, masks = envs.states, envs.masks
+
+        for total_reward, step in envs.pop_finished():
+            # Atualizar a Rede Alvo a cada 10 episódios (se o agente não o fizer por passos)
+            if episode % 10 == 0 and not agent.updates_target_by_steps:
+                agent.update_target_network()
+
+            # Reduzir Epsilon (explorar menos, explorar o conhecimento mais)
+            epsilon = max(epsilon_end, epsilon * epsilon_decay)
+
+            if episode % 10 == 0:
+                ms_per_1k = (time.perf_counter() - start_time) / env_steps * 1000 * 1000
+                print(f"Episódio {episode}: Passos={step}, Recompensa Material={total_reward}, "
+                      f"Epsilon={epsilon:.3f}, {ms_per_1k:.0f} ms/1k passos, Atualizações={agent.updates}")
+            episode += 1
+
+    if trace is not None:
+        trace.stop()
+    if logger is not None:
+        logger.close()
+        profiler.enabled = False
+
     # Guardar os pesos finais (o cérebro do agente)
-    torch.save(agent.policy_net.state_dict(), "chess_dqn.pth")
-    print("Treino concluído. Modelo guardado.")
+    if writer is not None:
+        writer.close()
+    if save_path:
+        save_checkpoint(agent.policy_net, save_path)
+        print("Treino concluído. Modelo guardado.")
+    agent.train_seconds = time.perf_counter() - start_time
+    agent.env_steps = env_steps
+    return agent
 
 if __name__ == "__main__":
-    train_agent()
+    parser = argparse.ArgumentParser(description="Treino do agente DQN de xadrez")
+    parser.add_argument("--episodes", type=int, default=500)
+    parser.add_argument("--num-envs", type=int, default=1,
+                        help="Número de jogos avançados em paralelo (por ator, com --actors)")
+    parser.add_argument("--train-every", type=int, default=1, help="Treinar a cada K passos de ambiente")
+    parser.add_argument("--gradient-steps", type=int, default=1, help="Passos de gradiente por treino")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--grad-accum-steps", type=int, default=1,
+                        help="Mini-lotes acumulados por passo de gradiente")
+    parser.add_argument("--target-tau", type=float, default=None,
+                        help="Atualização suave (Polyak) da rede alvo a cada passo")
+    parser.add_argument("--target-update-steps", type=int, default=None,
+                        help="Copiar a rede alvo a cada N passos de gradiente")
+    parser.add_argument("--checkpoint-every", type=int, default=None,
+                        help="Gravar chess_dqn.pth em segundo plano a cada N passos de gradiente")
+    parser.add_argument("--amp", choices=["bfloat16", "float16"], default=None,
+                        help="Treino em precisão mista (bfloat16 também em CPU)")
+    parser.add_argument("--channels-last", action="store_true", help="Layout channels-last nas convoluções")
+    parser.add_argument("--compile", action="store_true", help="Usar torch.compile no treino")
+    parser.add_argument("--prioritized", action="store_true",
+                        help="Memória de repetição com prioridades (erro TD)")
+    parser.add_argument("--head", choices=["dense", "compact"], default="dense",
+                        help="Cabeça de ação: densa (4096 saídas) ou compacta (só as jogadas legais)")
+    parser.add_argument("--log", default=None,
+                        help="Ficheiro .csv ou .jsonl para as métricas por fase (liga a medição)")
+    parser.add_argument("--log-every", type=int, default=1000, help="Exportar métricas a cada N passos de ambiente")
+    parser.add_argument("--profile", choices=["cprofile", "torch"], default=None,
+                        help="Capturar um perfil de uma janela de passos")
+    parser.add_argument("--profile-start", type=int, default=100, help="Passo em que começa o perfil")
+    parser.add_argument("--profile-steps", type=int, default=50, help="Número de passos do perfil")
+    parser.add_argument("--actors", type=int, default=0,
+                        help="Número de processos ator (0 = treino num só processo)")
+    parser.add_argument("--central-inference", action="store_true",
+                        help="Com --actors: as jogadas dos atores são calculadas em lote no learner")
+    parser.add_argument("--max-batch", type=int, default=64, help="Tamanho máximo do lote de inferência")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="Espera máxima para juntar um lote")
+    args = parser.parse_args()
+    if args.actors > 0:
+        # O modo ator/learner não usa estas opções: recusá-las em vez de as ignorar
+        unsupported = [name for name in ("train_every", "gradient_steps", "batch_size", "grad_accum_steps",
+                                         "target_tau", "target_update_steps", "checkpoint_every", "amp",
+                                         "channels_last", "compile", "prioritized", "head", "log", "profile")
+                       if getattr(args, name) != parser.get_default(name)]
+        if unsupported:
+            parser.error("com --actors não são suportadas: " +
+                         ", ".join("--" + name.replace("_", "-") for name in unsupported))
+        from actors import train_distributed
+        train_distributed(args.episodes, num_actors=args.actors, envs_per_actor=args.num_envs,
+                          central_inference=args.central_inference,
+                          max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    else:
+        train_agent(args.episodes, args.num_envs, args.train_every, args.gradient_steps, args.batch_size,
+                    args.grad_accum_steps, args.target_tau, args.target_update_steps, args.checkpoint_every,
+                    amp_dtype=args.amp, channels_last=args.channels_last, compile_model=args.compile,
+                    prioritized=args.prioritized, log_path=args.log, log_every=args.log_every,
+                    profile=args.profile, profile_start=args.profile_start, profile_steps=args.profile_steps,
+                    head=args.head)
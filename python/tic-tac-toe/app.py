@@ -1,55 +1,90 @@
 from flask import Flask, render_template, request, jsonify
 import numpy as np
+import os
+import threading
+from collections import OrderedDict
+from positions import encode, load_table
+from solver import Solver, check_win, HUMAN, AI
+from mnk import MNKGame, Engine
 
 app = Flask(__name__)
 
-# Configurações
-HUMAN = 1
-AI = -1
+def load_move_table(path=None):
+    # Melhor jogada da IA por índice base 3 do tabuleiro (-1 se não estiver na tabela),
+    # gerada pelo train.py (ou a do QLearner, do selfplay.py, com TTT_MOVE_TABLE)
+    # e aberta com memory-map
+    path = path or os.environ.get('TTT_MOVE_TABLE',
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'best_moves.npy'))
+    try:
+        return load_table(path)
+    except FileNotFoundError:
+        print(f"'{path}' não encontrado: todas as jogadas vão ser calculadas com o alpha-beta.")
+        return None
 
-def check_win(board):
-    # Verifica todas as combinações de vitória
-    win_p = [[0,1,2],[3,4,5],[6,7,8], # Linhas
-             [0,3,6],[1,4,7],[2,5,8], # Colunas
-             [0,4,8],[2,4,6]]         # Diagonais
-    
-    for p in win_p:
-        s = board[p[0]] + board[p[1]] + board[p[2]]
-        if s == 3: return HUMAN   # Humano ganhou
-        if s == -3: return AI     # IA ganhou
-        
-    if 0 not in board: return 0   # Empate
-    return None                   # Jogo continua
-
-def minimax(board, depth, is_maximizing):
-    result = check_win(board)
-    
-    # Pontuações ajustadas pela profundidade para preferir vitórias rápidas e derrotas tardias
-    if result == AI:
-        return 100 - depth
-    elif result == HUMAN:
-        return -100 + depth
-    elif result == 0:
-        return 0
-
-    if is_maximizing:
-        best_score = -float('inf')
-        for i in range(9):
-            if board[i] == 0:
-                board[i] = AI
-                score = minimax(board, depth + 1, False)
-                board[i] = 0 
-                best_score = max(score, best_score)
-        return best_score
+# Carregada uma única vez, no arranque
+MOVE_TABLE = load_move_table()
+
+# Procura de recurso (alpha-beta com memória partilhada entre pedidos)
+SOLVER = Solver()
+
+# Motores m,n,k, um por (largura, altura, k), criados no primeiro pedido e com
+# a tabela de transposições partilhada entre pedidos. Só ficam os MAX_ENGINES
+# usados mais recentemente, para os clientes não fazerem crescer a memória.
+ENGINES = OrderedDict()
+ENGINES_LOCK = threading.Lock()
+MAX_ENGINES = 8
+ENGINE_TABLE_ENTRIES = 500_000
+# Lado máximo do tabuleiro (a criação do jogo não conta para o orçamento de tempo)
+MAX_SIZE = 15
+# Tempo de procura por pedido no motor m,n,k (pode vir no pedido em 'time_ms')
+DEFAULT_TIME_MS = 500
+MAX_TIME_MS = 5000
+
+def get_engine(width, height, k):
+    key = (width, height, k)
+    with ENGINES_LOCK:
+        engine = ENGINES.get(key)
+        if engine is None:
+            engine = ENGINES[key] = Engine(MNKGame(width, height, k), ENGINE_TABLE_ENTRIES)
+            if len(ENGINES) > MAX_ENGINES:
+                ENGINES.popitem(last=False)
+        ENGINES.move_to_end(key)
+    return engine
+
+def _is_int(x):
+    return isinstance(x, int) and not isinstance(x, bool)
+
+def board_size(data):
+    # 'size': n (tabuleiro n x n) ou [largura, altura]; 'k' por omissão é o lado menor.
+    # Pedidos inválidos dão ValueError (resposta 400)
+    size = data['size']
+    if _is_int(size):
+        width = height = size
+    elif isinstance(size, list) and len(size) == 2 and all(_is_int(x) for x in size):
+        width, height = size
     else:
-        best_score = float('inf')
-        for i in range(9):
-            if board[i] == 0:
-                board[i] = HUMAN
-                score = minimax(board, depth + 1, True)
-                board[i] = 0 
-                best_score = min(score, best_score)
-        return best_score
+        raise ValueError("'size' tem de ser um inteiro n ou [largura, altura]")
+    k = data.get('k', min(width, height))
+    if not _is_int(k):
+        raise ValueError("'k' tem de ser um inteiro")
+    if not (1 <= width <= MAX_SIZE and 1 <= height <= MAX_SIZE):
+        raise ValueError(f"o tabuleiro tem de ter entre 1 e {MAX_SIZE} casas de lado")
+    return width, height, k
+
+def board_cells(data, width=3, height=3):
+    # 'board': lista de largura * altura casas (linha a linha) com 1/-1/0
+    board = data.get('board')
+    if not isinstance(board, list) or len(board) != width * height:
+        raise ValueError(f"'board' tem de ser uma lista com as {width * height} casas do tabuleiro {width}x{height}")
+    if any(x not in (HUMAN, AI, 0) or isinstance(x, bool) for x in board):
+        raise ValueError("as casas do tabuleiro têm de ser 1, -1 ou 0")
+    return board
+
+def time_budget(data):
+    time_ms = data.get('time_ms', DEFAULT_TIME_MS)
+    if not isinstance(time_ms, (int, float)) or isinstance(time_ms, bool) or not time_ms > 0:
+        raise ValueError("'time_ms' tem de ser um número positivo")
+    return min(time_ms, MAX_TIME_MS) / 1e3
 
 @app.route('/')
 def index():
@@ -57,8 +92,19 @@ def index():
 
 @app.route('/play', methods=['POST'])
 def play():
-    # Recebe o tabuleiro atual
-    board = np.array(request.json['board'], dtype=int)
+    # Corpo que não seja um objeto JSON dá 400, tal como campos em falta ou inválidos
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': "o pedido tem de ser um objeto JSON"}), 400
+    try:
+        # Com 'size' no pedido joga o motor m,n,k (qualquer tamanho, também 3x3);
+        # sem ele, o jogo do galo normal com a tabela de jogadas
+        if 'size' in data:
+            return play_mnk(data, *board_size(data), time_budget(data))
+        # Recebe o tabuleiro atual
+        board = np.array(board_cells(data), dtype=int)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Verifica se já acabou antes de jogar
     if check_win(board) is not None:
@@ -81,21 +127,26 @@ def play():
             if board[c] == 0:
                 return jsonify({'move': c})
 
-    # Para outras situações, usa o minimax para escolher a melhor jogada
-    best_score = -float('inf')
-    best_move = None
-    
-    # Analisa todas as jogadas possíveis
-    for i in avail:
-        board[i] = AI 
-        score = minimax(board, 0, False) 
-        board[i] = 0 
-        
-        if score > best_score:
-            best_score = score
-            best_move = i
+    # Para outras situações, a melhor jogada vem da tabela (O(1));
+    # só as posições que lá não estão são calculadas com o alpha-beta
+    best_move = MOVE_TABLE[encode(board)] if MOVE_TABLE is not None else -1
+    if best_move < 0:
+        best_move = SOLVER.best_move(board)
             
     return jsonify({'move': int(best_move)})
 
+def play_mnk(data, width, height, k, seconds):
+    # Tabuleiro validado antes de criar o motor (que pode ser novo e grande)
+    board = board_cells(data, width, height)
+    engine = get_engine(width, height, k)
+
+    game = engine.game
+    ai, human = game.to_masks(board, AI)
+    if game.is_win(human) or game.is_win(ai) or human | ai == game.full:
+        return jsonify({'move': None})
+
+    move, value, depth, nodes = engine.search(ai, human, seconds)
+    return jsonify({'move': move, 'depth': depth, 'nodes': nodes})
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
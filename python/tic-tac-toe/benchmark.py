@@ -0,0 +1,174 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from solver import Solver, check_win
+from mnk import MNKGame, Engine, MATE_BOUND
+
+HUMAN = 1
+AI = -1
+
+class LegacyMinimax:
+    """minimax original (sem memória nem cortes, check_win pelas 8 linhas), com contador de nós"""
+    win_p = [[0,1,2],[3,4,5],[6,7,8],[0,3,6],[1,4,7],[2,5,8],[0,4,8],[2,4,6]]
+
+    def __init__(self):
+        self.nodes = 0
+        self.policy = {}
+
+    def check_win(self, board):
+        for p in self.win_p:
+            s = board[p[0]] + board[p[1]] + board[p[2]]
+            if s == 3: return HUMAN
+            if s == -3: return AI
+        if 0 not in board: return 0
+        return None
+
+    def minimax(self, board, depth, is_maximizing, record=False):
+        self.nodes += 1
+        result = self.check_win(board)
+        if result == AI:
+            return 100 - depth
+        elif result == HUMAN:
+            return -100 + depth
+        elif result == 0:
+            return 0
+        best_score = -float('inf') if is_maximizing else float('inf')
+        for i in range(9):
+            if board[i] == 0:
+                board[i] = AI if is_maximizing else HUMAN
+                score = self.minimax(board, depth + 1, not is_maximizing, record)
+                board[i] = 0
+                best_score = max(score, best_score) if is_maximizing else min(score, best_score)
+        if record:
+            self.policy[str(board.tolist())] = best_score
+        return best_score
+
+    def best_move(self, board):
+        # Ciclo da rota /play original
+        best_score, best_move = -float('inf'), None
+        for i in [i for i, x in enumerate(board) if x == 0]:
+            board[i] = AI
+            score = self.minimax(board, 0, False)
+            board[i] = 0
+            if score > best_score:
+                best_score, best_move = score, i
+        return best_move
+
+def query_boards(n, seed=0):
+    # Posições fixas com a IA a jogar: o tabuleiro vazio e posições a meio do jogo
+    rng = random.Random(seed)
+    boards = [np.zeros(9, dtype=int)]
+    while len(boards) < n:
+        board = np.zeros(9, dtype=int)
+        player = rng.choice([HUMAN, AI])
+        for _ in range(rng.randint(1, 5)):
+            board[rng.choice(list(np.flatnonzero(board == 0)))] = player
+            player = -player
+        if player == AI and check_win(board) is None:
+            boards.append(board)
+    return boards
+
+def bench_table():
+    """Gerar a tabela completa: minimax original (duas procuras) vs solver com memória"""
+    legacy = LegacyMinimax()
+    board = np.zeros(9, dtype=int)
+    start = time.perf_counter()
+    legacy.minimax(board, 0, False, record=True)
+    legacy.minimax(board, 0, True, record=True)
+    legacy_seconds = time.perf_counter() - start
+
+    solver = Solver()
+    start = time.perf_counter()
+    solver.solve(0, 0, False)
+    solver.solve(0, 0, True)
+    solver_seconds = time.perf_counter() - start
+    print(f"Tabela completa: minimax {legacy_seconds:7.2f} s {legacy.nodes:>9} nós | "
+          f"solver {solver_seconds * 1e3:7.1f} ms {solver.nodes:>7} nós")
+
+def bench_queries(n=30):
+    """Jogada pedida à app: ciclo de minimax original vs alpha-beta (solver novo em cada consulta)"""
+    boards = query_boards(n)
+    results = {}
+    moves = {}
+    for name, make in (("minimax", LegacyMinimax), ("alpha-beta", Solver)):
+        nodes, seconds, chosen = 0, 0.0, []
+        for board in boards:
+            engine = make()
+            start = time.perf_counter()
+            chosen.append(engine.best_move(board.copy()))
+            seconds += time.perf_counter() - start
+            nodes += engine.nodes
+        moves[name] = chosen
+        results[name] = (seconds, nodes)
+        print(f"{name:>10}: {seconds / len(boards) * 1e3:9.2f} ms/consulta  {nodes / len(boards):10.0f} nós/consulta")
+    print(f"Mesmas jogadas em {len(boards)} posições:", moves["minimax"] == moves["alpha-beta"])
+    return results
+
+def mnk_boards(game, n, seed=0):
+    # Posições m,n,k com a IA a jogar: o tabuleiro vazio e posições com algumas peças ao acaso
+    rng = random.Random(seed)
+    boards = [[0] * game.cells]
+    while len(boards) < n:
+        board = [0] * game.cells
+        player = rng.choice([HUMAN, AI])
+        for _ in range(rng.randint(1, game.cells // 3)):
+            board[rng.choice([i for i, x in enumerate(board) if x == 0])] = player
+            player = -player
+        ai, human = game.to_masks(board, AI)
+        if player == AI and not game.is_win(human) and not game.is_win(ai):
+            boards.append(board)
+    return boards
+
+def check_mnk_eval(size=15, k=12, time_ms=200):
+    """
+    Com k grande a avaliação não pode passar MATE_BOUND: a IA com k - 2 peças
+    seguidas na primeira linha (4 ** 10 na avaliação, com k=12) ainda não tem
+    vitória forçada, por isso o valor da procura tem de ficar abaixo.
+    """
+    engine = Engine(MNKGame(size, size, k))
+    board = [0] * (size * size)
+    for c in range(k - 2):
+        board[c] = AI
+        board[(size - 1) * size + c] = HUMAN
+    ai, human = engine.game.to_masks(board, AI)
+    move, value, depth, nodes = engine.search(ai, human, time_ms / 1e3)
+    if abs(value) > MATE_BOUND:
+        raise AssertionError(f"{size}x{size} k={k}: valor {value} na profundidade {depth} parece vitória forçada")
+    print(f"{size}x{size} k={k}: valor {value} na profundidade {depth} ({nodes} nós), abaixo de MATE_BOUND")
+
+def bench_mnk(n=10, time_ms=(100, 500)):
+    """Motor m,n,k: nós/s da procura e latência do /play para 3x3, 4x4 e 5x5 (k=4)"""
+    check_mnk_eval()
+    import app as app_module
+    client = app_module.app.test_client()
+    for width, height, k in ((3, 3, 3), (4, 4, 4), (5, 5, 4)):
+        boards = mnk_boards(MNKGame(width, height, k), n)
+        for budget in time_ms:
+            # Motor novo: a tabela de transposições começa vazia em cada medição
+            app_module.ENGINES[(width, height, k)] = Engine(MNKGame(width, height, k))
+            latencies, nodes, depths = [], 0, []
+            for board in boards:
+                start = time.perf_counter()
+                response = client.post('/play', json={'board': board, 'size': [width, height], 'k': k,
+                                                      'time_ms': budget}).get_json()
+                latencies.append(time.perf_counter() - start)
+                nodes += response['nodes']
+                depths.append(response['depth'])
+            latencies = np.array(latencies) * 1e3
+            print(f"{width}x{height} k={k} orçamento {budget:4d} ms: {nodes / latencies.sum() * 1e3:9.0f} nós/s  "
+                  f"p50={np.percentile(latencies, 50):7.1f} ms  p99={np.percentile(latencies, 99):7.1f} ms  "
+                  f"profundidade {min(depths)}-{max(depths)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Comparação do minimax original com o solver")
+    parser.add_argument("bench", choices=["table", "queries", "mnk"])
+    args = parser.parse_args()
+    if args.bench == "table":
+        bench_table()
+    elif args.bench == "mnk":
+        bench_mnk()
+    else:
+        bench_queries()
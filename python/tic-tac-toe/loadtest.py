@@ -0,0 +1,69 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+import app as app_module
+from benchmark import LegacyMinimax
+from solver import Solver
+
+def mid_game_boards(n, seed=0):
+    # Posições fixas a meio do jogo, com a IA a jogar (tiradas de jogos aleatórios)
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < n:
+        board = [0] * 9
+        player = rng.choice([app_module.HUMAN, app_module.AI])
+        for _ in range(rng.randint(2, 5)):
+            if app_module.check_win(np.array(board)) is not None:
+                break
+            board[rng.choice([i for i, x in enumerate(board) if x == 0])] = player
+            player = -player
+        if player == app_module.AI and app_module.check_win(np.array(board)) is None:
+            boards.append(board)
+    return boards
+
+def run(client, boards, requests):
+    latencies = []
+    moves = []
+    start = time.perf_counter()
+    for i in range(requests):
+        t = time.perf_counter()
+        response = client.post('/play', json={'board': boards[i % len(boards)]})
+        latencies.append(time.perf_counter() - t)
+        moves.append(response.get_json()['move'])
+    seconds = time.perf_counter() - start
+    latencies = np.array(latencies) * 1e3
+    return requests / seconds, np.percentile(latencies, 50), np.percentile(latencies, 99), moves
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Teste de carga do endpoint /play: minimax original, solver e tabela")
+    parser.add_argument('--requests', type=int, default=2000, help="Pedidos com a tabela")
+    parser.add_argument('--search-requests', type=int, default=20,
+                        help="Pedidos só com a procura (minimax original, que é lento, e solver novo)")
+    parser.add_argument('--boards', type=int, default=50, help="Posições a meio do jogo")
+    args = parser.parse_args()
+
+    client = app_module.app.test_client()
+    table = app_module.MOVE_TABLE
+    solver = app_module.SOLVER
+    scenarios = [("tabuleiro vazio", [[0] * 9]), ("meio do jogo", mid_game_boards(args.boards))]
+    for name, boards in scenarios:
+        app_module.MOVE_TABLE = None
+        # Antes: a procura original, um minimax completo em cada pedido
+        app_module.SOLVER = LegacyMinimax()
+        search_requests = min(args.search_requests, 3) if name == "tabuleiro vazio" else args.search_requests
+        before = run(client, boards, search_requests)
+        # Solver novo em cada cenário: a memória começa vazia, como no arranque da app
+        app_module.SOLVER = Solver()
+        searched = run(client, boards, search_requests)
+        app_module.SOLVER = solver
+        app_module.MOVE_TABLE = table
+        after = run(client, boards, args.requests)
+        same = before[3] == searched[3] == after[3][:len(before[3])]
+        print(f"{name}:")
+        print(f"  minimax: {before[0]:8.1f} pedidos/s  p50={before[1]:8.2f} ms  p99={before[2]:8.2f} ms")
+        print(f"  solver:  {searched[0]:8.1f} pedidos/s  p50={searched[1]:8.2f} ms  p99={searched[2]:8.2f} ms")
+        print(f"  tabela:  {after[0]:8.1f} pedidos/s  p50={after[1]:8.2f} ms  p99={after[2]:8.2f} ms")
+        print(f"  mesmas jogadas: {same}")
@@ -0,0 +1,207 @@
+import time
+
+# Pontuação de vitória: WIN - ply, para preferir vitórias rápidas e derrotas tardias
+WIN = 1_000_000
+MATE_BOUND = WIN - 1_000
+# A avaliação estática fica sempre abaixo de MATE_BOUND: com k grande (4 ** k
+# por linha) passaria o limite e pareceria uma vitória forçada
+EVAL_BOUND = MATE_BOUND - 1
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class _Timeout(Exception):
+    pass
+
+class _Search:
+    """Estado de uma procura (prazo e nós), separado do Engine partilhado entre pedidos"""
+    __slots__ = ("deadline", "nodes")
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.nodes = 0
+
+class MNKGame:
+    """
+    Jogo m,n,k (tabuleiro width x height, ganha quem alinhar k peças) sobre
+    bitboards inteiros: bit i = casa i (linha i // width, coluna i % width).
+    As máscaras de vitória são pré-calculadas, e para cada casa guardam-se
+    só as que passam por ela (uma jogada só pode completar essas).
+    """
+    def __init__(self, width=3, height=3, k=3):
+        if not 1 <= k <= max(width, height):
+            raise ValueError(f"k={k} impossível num tabuleiro {width}x{height}")
+        self.width, self.height, self.k = width, height, k
+        self.cells = width * height
+        self.full = (1 << self.cells) - 1
+
+        lines = []
+        for r in range(height):
+            for c in range(width):
+                for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    end_r, end_c = r + dr * (k - 1), c + dc * (k - 1)
+                    if 0 <= end_r < height and 0 <= end_c < width:
+                        lines.append(sum(1 << ((r + dr * i) * width + c + dc * i) for i in range(k)))
+        self.lines = lines
+        self.lines_through = [[line for line in lines if line >> cell & 1] for cell in range(self.cells)]
+
+        # Ordem das jogadas: casas centrais primeiro (mais linhas, melhores cortes)
+        center_r, center_c = (height - 1) / 2, (width - 1) / 2
+        self.move_order = sorted(range(self.cells),
+                                 key=lambda i: abs(i // width - center_r) + abs(i % width - center_c))
+
+    def wins_with(self, mask, cell):
+        """True se `mask` (que acabou de ocupar `cell`) tem uma linha completa"""
+        for line in self.lines_through[cell]:
+            if mask & line == line:
+                return True
+        return False
+
+    def is_win(self, mask):
+        return any(mask & line == line for line in self.lines)
+
+    def to_masks(self, board, player):
+        """Tabuleiro em lista 1/-1/0 -> (máscara de `player`, máscara do adversário)"""
+        me = opp = 0
+        for i, x in enumerate(board):
+            if x == player:
+                me |= 1 << i
+            elif x:
+                opp |= 1 << i
+        return me, opp
+
+class Engine:
+    """
+    Alpha-beta (negamax) com aprofundamento iterativo, tabela de transposições
+    e orçamento de tempo por pedido. Nas folhas sem vencedor usa uma avaliação
+    das linhas ainda abertas. A tabela de transposições é mantida entre
+    pedidos (até max_entries posições); o prazo e a contagem de nós são de
+    cada procura, por isso várias threads podem procurar no mesmo Engine.
+    """
+    def __init__(self, game, max_entries=2_000_000):
+        self.game = game
+        self.max_entries = max_entries
+        self.table = {}
+        # Peso de uma linha aberta com n peças de um só jogador
+        self.weights = [0] + [4 ** n for n in range(1, game.k + 1)]
+
+    def evaluate(self, me, opp):
+        score = 0
+        for line in self.game.lines:
+            if not line & opp:
+                score += self.weights[(line & me).bit_count()]
+            elif not line & me:
+                score -= self.weights[(line & opp).bit_count()]
+        return max(-EVAL_BOUND, min(EVAL_BOUND, score))
+
+    def _negamax(self, search, me, opp, depth, ply, alpha, beta):
+        search.nodes += 1
+        if search.nodes & 1023 == 0 and time.perf_counter() > search.deadline:
+            raise _Timeout()
+
+        occupied = me | opp
+        if occupied == self.game.full:
+            return 0
+        if depth == 0:
+            return self.evaluate(me, opp)
+
+        key = me << self.game.cells | opp
+        entry = self.table.get(key)
+        best_move = None
+        if entry is not None:
+            entry_depth, value, flag, best_move = entry
+            if entry_depth >= depth:
+                # Vitórias guardadas relativas ao nó: voltar a contar desde a raiz
+                if value > MATE_BOUND:
+                    value -= ply
+                elif value < -MATE_BOUND:
+                    value += ply
+                if flag == EXACT:
+                    return value
+                if flag == LOWER and value >= beta:
+                    return value
+                if flag == UPPER and value <= alpha:
+                    return value
+
+        original_alpha = alpha
+        moves = self.game.move_order
+        if best_move is not None:
+            moves = [best_move] + [m for m in moves if m != best_move]
+
+        best_value = -WIN - 1
+        for move in moves:
+            bit = 1 << move
+            if occupied & bit:
+                continue
+            new_me = me | bit
+            if self.game.wins_with(new_me, move):
+                value = WIN - (ply + 1)
+            else:
+                value = -self._negamax(search, opp, new_me, depth - 1, ply + 1, -beta, -alpha)
+            if value > best_value:
+                best_value, best_move = value, move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        stored = best_value
+        if stored > MATE_BOUND:
+            stored += ply
+        elif stored < -MATE_BOUND:
+            stored -= ply
+        if len(self.table) >= self.max_entries:
+            self.table.clear()
+        self.table[key] = (depth, stored, flag, best_move)
+        return best_value
+
+    def search(self, me, opp, time_budget=0.5, max_depth=None):
+        """
+        Melhor jogada para quem tem as peças `me`. Aprofunda até acabar o
+        tempo, até max_depth, até esgotar o tabuleiro ou até encontrar uma
+        vitória/derrota forçada. Devolve (jogada, valor, profundidade
+        completa, nós visitados).
+        """
+        search = _Search(time.perf_counter() + time_budget)
+        empty = self.game.cells - (me | opp).bit_count()
+        max_depth = min(max_depth or empty, empty)
+
+        # Sem nenhuma iteração completa, joga a primeira casa livre pela ordem
+        best = (next(m for m in self.game.move_order if not (me | opp) >> m & 1), 0, 0)
+        for depth in range(1, max_depth + 1):
+            try:
+                value = self._root(search, me, opp, depth)
+            except _Timeout:
+                break
+            best = (value[0], value[1], depth)
+            if abs(value[1]) > MATE_BOUND:
+                break
+        return best[0], best[1], best[2], search.nodes
+
+    def _root(self, search, me, opp, depth):
+        occupied = me | opp
+        entry = self.table.get(me << self.game.cells | opp)
+        moves = self.game.move_order
+        if entry is not None and entry[3] is not None:
+            moves = [entry[3]] + [m for m in moves if m != entry[3]]
+
+        alpha, beta = -WIN - 1, WIN + 1
+        best_move, best_value = None, -WIN - 1
+        for move in moves:
+            bit = 1 << move
+            if occupied & bit:
+                continue
+            new_me = me | bit
+            if self.game.wins_with(new_me, move):
+                value = WIN - 1
+            else:
+                value = -self._negamax(search, opp, new_me, depth - 1, 1, -beta, -alpha)
+            if value > best_value:
+                best_value, best_move = value, move
+            alpha = max(alpha, value)
+        self.table[me << self.game.cells | opp] = (depth, best_value, EXACT, best_move)
+        return best_move, best_value
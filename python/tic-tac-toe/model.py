@@ -1,23 +1,29 @@
 import numpy as np
-import pickle
+from positions import NUM_STATES, CANONICAL, encode, child_indices, save_table, load_table
 
 class QLearner:
     def __init__(self):
-        self.q_table = {}
+        # Valor de cada posição depois da jogada da IA, indexado pelo tabuleiro
+        # canónico em base 3 (as 8 simetrias partilham a mesma entrada)
+        self.q_table = np.zeros(NUM_STATES, dtype=np.float32)
         self.lr = 0.2
         self.gamma = 0.9
         self.epsilon = 0.3
 
-    def get_state_key(self, board):
-        return str(board.tolist())
+    def get_state_index(self, board):
+        return CANONICAL[encode(board)]
 
     def choose_action(self, board, available_moves):
         if np.random.uniform(0, 1) < self.epsilon:
             return available_moves[np.random.choice(len(available_moves))]
         
-        values = []
-        for m in available_moves:
-            next_board = board.copy()
-            next_board[m] = -1
-            values.append(self.q_table.get(self.get_state_key(next_board), 0))
-        return available_moves[np.argmax(values)]
\ No newline at end of file
+        # Todas as jogadas avaliadas com uma só consulta à tabela
+        next_states = CANONICAL[child_indices(encode(board), available_moves, -1)]
+        return available_moves[np.argmax(self.q_table[next_states])]
+
+    def save(self, path='q_table.npy'):
+        save_table(path, self.q_table)
+
+    def load(self, path='q_table.npy', mmap_mode=None):
+        # mmap_mode='r' para só jogar (sem cópia); sem memory-map para continuar a treinar
+        self.q_table = load_table(path, mmap_mode)
@@ -0,0 +1,63 @@
+import numpy as np
+
+# Cada casa é um dígito em base 3 (0 = vazia, 1 = humano, 2 = IA),
+# por isso um tabuleiro é um inteiro entre 0 e 3^9 - 1
+NUM_STATES = 3 ** 9
+POW3 = 3 ** np.arange(9, dtype=np.int64)
+
+# Índices das tabelas de valores por jogador a jogar
+AI_TURN = 0
+HUMAN_TURN = 1
+
+# Valor das posições que não estão na tabela (as pontuações vão de -100 a 100)
+MISSING = -128
+
+def encode(boards):
+    """Índice base 3 de um tabuleiro (9,) ou de um lote (N, 9) com valores 1/-1/0"""
+    digits = np.asarray(boards) % 3 # -1 (IA) passa a 2
+    return digits.dot(POW3)
+
+def decode(indices):
+    """Operação inversa de encode: devolve tabuleiros (..., 9) em int8 com 1/-1/0"""
+    digits = (np.asarray(indices)[..., None] // POW3) % 3
+    return np.where(digits == 2, -1, digits).astype(np.int8)
+
+def _symmetries():
+    # As 8 simetrias do quadrado (4 rotações, com e sem espelho), como permutações
+    # das casas: o tabuleiro transformado é board[perm]
+    grid = np.arange(9).reshape(3, 3)
+    perms = []
+    for k in range(4):
+        rotated = np.rot90(grid, k)
+        perms.append(rotated.ravel())
+        perms.append(np.fliplr(rotated).ravel())
+    return np.array(perms)
+
+SYMMETRIES = _symmetries()
+
+def _canonical_table():
+    # Para cada índice, o menor índice entre as 8 versões simétricas do tabuleiro
+    boards = decode(np.arange(NUM_STATES))
+    codes = np.stack([encode(boards[:, perm]) for perm in SYMMETRIES])
+    return codes.min(axis=0).astype(np.int32)
+
+# Calculada uma vez na importação (19683 entradas, alguns ms)
+CANONICAL = _canonical_table()
+
+def canonical(boards):
+    """Índice canónico (igual para as 8 simetrias) de um tabuleiro ou lote"""
+    return CANONICAL[encode(boards)]
+
+def child_indices(index, moves, player):
+    """
+    Índices dos tabuleiros depois de `player` jogar em cada uma das casas
+    `moves` (vazias), calculados sem copiar o tabuleiro.
+    """
+    return index + (player % 3) * POW3.take(moves)
+
+def save_table(path, table):
+    np.save(path, table)
+
+def load_table(path, mmap_mode="r"):
+    """Carrega uma tabela .npy sem a copiar para memória (memory-map)"""
+    return np.load(path, mmap_mode=mmap_mode)
@@ -0,0 +1,250 @@
+import argparse
+import time
+
+import numpy as np
+
+from model import QLearner
+from positions import NUM_STATES, POW3, CANONICAL, encode, decode, save_table
+from solver import Solver, WINS, FULL, SQUARES, to_masks, board_index
+
+BITS = 1 << np.arange(9)
+WIN_TABLE = np.array(WINS)
+
+# Convenção do treino: os tabuleiros são vistos por quem joga, que tem sempre
+# as peças -1 (como a IA da app); depois de cada jogada o tabuleiro é negado.
+# Assim as duas cores partilham a mesma tabela de valores (pós-jogada).
+
+def _move_values(q_table, boards):
+    """Valores (N, 9) das posições depois de jogar em cada casa (-inf nas ocupadas)"""
+    empty = boards == 0
+    children = np.where(empty, encode(boards)[:, None] + 2 * POW3, 0)
+    return np.where(empty, q_table[CANONICAL[children]], -np.inf), empty
+
+def choose_moves(q_table, boards, epsilon, rng):
+    """Epsilon-greedy em lote: uma jogada para cada tabuleiro, com uma só consulta à tabela"""
+    values, empty = _move_values(q_table, boards)
+    explore = rng.random(len(boards)) < epsilon
+    if explore.any():
+        # Exploração: casa vazia ao acaso (valores aleatórios só nas casas livres)
+        values[explore] = np.where(empty[explore], rng.random((explore.sum(), 9)), -np.inf)
+    return values.argmax(1)
+
+def _td_update(q, lr, idx, targets):
+    """
+    q[idx] += lr * (targets - q[idx]) para um lote inteiro. Posições repetidas
+    no lote (muitas, no início dos jogos) dão um só passo em direção à média
+    dos alvos: somar um passo por ocorrência faria a tabela divergir.
+    """
+    sums = np.bincount(idx, weights=targets - q[idx], minlength=len(q))
+    counts = np.bincount(idx, minlength=len(q))
+    touched = np.flatnonzero(counts)
+    q[touched] += lr * (sums[touched] / counts[touched])
+
+def _final_eval(history, games, seconds, q, evaluator):
+    # Avaliação no fim do treino, se a última não foi já no último jogo
+    # (com eval_every maior do que games nenhuma teria corrido)
+    if not history or history[-1][0] < games:
+        history.append((games, seconds, evaluator(q) if evaluator is not None else None))
+
+def train_batched(learner, games=200_000, batch=4096, epsilon_end=0.01, lr_end=0.01, seed=0,
+                  eval_every=None, evaluator=None):
+    """
+    Self-play de `batch` jogos em simultâneo como um array (batch, 9): escolha
+    das jogadas, deteção de vitórias e atualizações TD(0) dos valores
+    pós-jogada são operações em lote sobre todos os jogos. O epsilon e a taxa
+    de aprendizagem descem linearmente de learner.epsilon e learner.lr até
+    epsilon_end e lr_end: com a taxa fixa, os últimos jogos exploratórios
+    continuam a mexer na tabela e o resultado oscila entre avaliações.
+    Devolve o histórico de avaliações [(jogos, segundos, resultado do evaluator)].
+    """
+    rng = np.random.default_rng(seed)
+    q = learner.q_table
+    rows = np.arange(batch)
+    boards = np.zeros((batch, 9), dtype=np.int8)
+    prev = np.full((batch, 2), -1, dtype=np.int64) # Última posição pós-jogada de cada jogador
+    turn = np.zeros(batch, dtype=np.int64)
+    finished = 0
+    history = []
+    next_eval = eval_every or games
+    start = time.perf_counter()
+    elapsed = 0.0
+
+    while finished < games:
+        progress = finished / games
+        epsilon = learner.epsilon + (epsilon_end - learner.epsilon) * progress
+        lr = learner.lr + (lr_end - learner.lr) * progress
+        moves = choose_moves(q, boards, epsilon, rng)
+        boards[rows, moves] = -1
+        after = CANONICAL[encode(boards)]
+
+        win = WIN_TABLE[(boards == -1) @ BITS]
+        done = win | (boards != 0).all(1)
+        reward = win.astype(np.float32) # 1 por ganhar, 0 por empatar
+
+        # TD(0): a posição anterior de quem jogou aproxima-se do valor da atual;
+        # no fim do jogo a posição final vale a recompensa e a última do adversário o simétrico
+        mine = prev[rows, turn]
+        has = mine >= 0
+        theirs = prev[rows, 1 - turn]
+        lost = done & (theirs >= 0)
+        _td_update(q, lr,
+                   np.concatenate([mine[has], after[done], theirs[lost]]),
+                   np.concatenate([learner.gamma * q[after[has]], reward[done], -reward[lost]]))
+
+        prev[rows, turn] = after
+        boards = -boards
+        turn = 1 - turn
+        # Jogos acabados recomeçam já, no mesmo lote
+        boards[done] = 0
+        prev[done] = -1
+        turn[done] = 0
+        finished += int(done.sum())
+
+        if evaluator is not None and finished >= next_eval:
+            elapsed += time.perf_counter() - start
+            history.append((finished, elapsed, evaluator(q)))
+            next_eval += eval_every or games
+            start = time.perf_counter()
+    _final_eval(history, finished, elapsed + time.perf_counter() - start, q, evaluator)
+    return history
+
+def train_naive(learner, games=5_000, epsilon_end=0.01, lr_end=0.01, seed=0, eval_every=None, evaluator=None):
+    """O mesmo treino, um jogo de cada vez com QLearner.choose_action e atualizações escalares"""
+    np.random.seed(seed)
+    q = learner.q_table
+    epsilon_start = learner.epsilon
+    history = []
+    next_eval = eval_every or games
+    start = time.perf_counter()
+    elapsed = 0.0
+    for game in range(1, games + 1):
+        progress = (game - 1) / games
+        learner.epsilon = epsilon_start + (epsilon_end - epsilon_start) * progress
+        lr = learner.lr + (lr_end - learner.lr) * progress
+        board = np.zeros(9, dtype=np.int8)
+        prev = [-1, -1]
+        turn = 0
+        while True:
+            avail = [i for i, x in enumerate(board) if x == 0]
+            board[learner.choose_action(board, avail)] = -1
+            after = learner.get_state_index(board)
+            won = WINS[to_masks(board)[1]]
+            done = won or not (board == 0).any()
+            if prev[turn] >= 0:
+                q[prev[turn]] += lr * (learner.gamma * q[after] - q[prev[turn]])
+            if done:
+                reward = 1.0 if won else 0.0
+                q[after] += lr * (reward - q[after])
+                if prev[1 - turn] >= 0:
+                    q[prev[1 - turn]] += lr * (-reward - q[prev[1 - turn]])
+                break
+            prev[turn] = after
+            board = -board
+            turn = 1 - turn
+        if evaluator is not None and game >= next_eval:
+            elapsed += time.perf_counter() - start
+            history.append((game, elapsed, evaluator(q)))
+            next_eval += eval_every or games
+            start = time.perf_counter()
+    learner.epsilon = epsilon_start
+    _final_eval(history, games, elapsed + time.perf_counter() - start, q, evaluator)
+    return history
+
+def optimal_moves_table():
+    """
+    Para cada posição com a IA (-1) a jogar, máscara de 9 bits das jogadas
+    ótimas segundo o solver (as de valor máximo). Serve de adversário perfeito.
+    """
+    solver = Solver()
+    solver.solve(0, 0, False)
+    solver.solve(0, 0, True)
+    table = np.zeros(NUM_STATES, dtype=np.int16)
+    for key in list(solver.moves):
+        human, ai = key >> 10, key >> 1 & FULL
+        scores = {sq: solver.solve(human, ai | 1 << sq, False) for sq in SQUARES[FULL & ~(human | ai)]}
+        best = max(scores.values())
+        table[board_index(human, ai)] = sum(1 << sq for sq, s in scores.items() if s == best)
+    return table
+
+def evaluate(q_table, optimal=None, games=2_000, seed=1):
+    """
+    Jogos do QLearner (greedy) contra o jogador perfeito (com a tabela de
+    optimal_moves_table, escolhendo ao acaso entre as jogadas ótimas) ou,
+    sem ela, contra um jogador aleatório; metade a começar cada um. Devolve
+    as frações (vitórias, empates, derrotas) do QLearner.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.arange(games)
+    # Quem joga vê sempre o tabuleiro com as suas peças a -1
+    boards = np.zeros((games, 9), dtype=np.int8)
+    learner_turn = rows % 2 == 0
+    result = np.zeros(games, dtype=np.int8) # 1 ganhou o QLearner, -1 perdeu, 0 empate
+    active = np.ones(games, dtype=np.bool_)
+    while active.any():
+        b = boards[active]
+        values, empty = _move_values(q_table, b)
+        if optimal is not None:
+            masks = optimal[encode(b)]
+            allowed = (masks[:, None] >> np.arange(9)) & 1 == 1
+        else:
+            allowed = empty
+        opponent_values = np.where(allowed, rng.random(b.shape), -np.inf)
+        moves = np.where(learner_turn[active], values.argmax(1), opponent_values.argmax(1))
+        idx = rows[active]
+        boards[idx, moves] = -1
+        b = boards[idx]
+        win = WIN_TABLE[(b == -1) @ BITS]
+        done = win | (b != 0).all(1)
+        result[idx[win]] = np.where(learner_turn[idx[win]], 1, -1)
+        active[idx[done]] = False
+        boards[idx] = -b
+        learner_turn[idx] = ~learner_turn[idx]
+    return (result == 1).mean(), (result == 0).mean(), (result == -1).mean()
+
+def greedy_moves_table(q_table):
+    """Jogada greedy do QLearner por índice base 3 (-1 sem jogadas), no formato de best_moves.npy"""
+    boards = decode(np.arange(NUM_STATES))
+    values, empty = _move_values(q_table, boards)
+    return np.where(empty.any(1), values.argmax(1), -1).astype(np.int8)
+
+def _report(name, history):
+    for games, seconds, (perfect, random_) in history:
+        print(f"{name:>10} {games:>8} jogos  {games / seconds:10.0f} jogos/s  "
+              f"vs perfeito: empates={perfect[1]:.1%} derrotas={perfect[2]:.1%}  "
+              f"vs aleatório: vitórias={random_[0]:.1%} derrotas={random_[2]:.1%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Treino do QLearner por self-play em lote")
+    parser.add_argument("--games", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=4096, help="Jogos em simultâneo")
+    parser.add_argument("--naive-games", type=int, default=20_000, help="Jogos do ciclo simples (comparação)")
+    parser.add_argument("--eval-every", type=int, default=20_000)
+    parser.add_argument("--epsilon-end", type=float, default=0.01)
+    parser.add_argument("--lr-end", type=float, default=0.01, help="Taxa de aprendizagem no fim do treino")
+    parser.add_argument("--min-draw-rate", type=float, default=0.99,
+                        help="Fração mínima de empates contra o jogador perfeito (senão não grava as tabelas)")
+    parser.add_argument("--out", default="q_table.npy")
+    parser.add_argument("--moves-out", default="q_moves.npy",
+                        help="Tabela de jogadas para a app (TTT_MOVE_TABLE=q_moves.npy python app.py)")
+    args = parser.parse_args()
+
+    optimal = optimal_moves_table()
+    evaluator = lambda q: (evaluate(q, optimal), evaluate(q))
+
+    learner = QLearner()
+    _report("lote", train_batched(learner, args.games, args.batch, args.epsilon_end, args.lr_end,
+                                  eval_every=args.eval_every, evaluator=evaluator))
+    if args.naive_games:
+        naive = QLearner()
+        _report("um a um", train_naive(naive, args.naive_games, args.epsilon_end, args.lr_end,
+                                       eval_every=args.eval_every, evaluator=evaluator))
+
+    # O QLearner greedy nunca deve perder contra o jogador perfeito: só empates
+    _, draws, losses = evaluate(learner.q_table, optimal, games=10_000, seed=2)
+    print(f"Tabela final vs perfeito: empates={draws:.2%} derrotas={losses:.2%} (mínimo {args.min_draw_rate:.0%})")
+    if draws < args.min_draw_rate:
+        raise SystemExit("Treino não convergiu: as tabelas não foram gravadas.")
+
+    learner.save(args.out)
+    save_table(args.moves_out, greedy_moves_table(learner.q_table))
+    print(f"Tabelas gravadas em '{args.out}' e '{args.moves_out}'.")
@@ -0,0 +1,159 @@
+from positions import POW3
+
+HUMAN = 1
+AI = -1
+
+# Cada jogador é uma máscara de 9 bits (bit i = casa i ocupada por ele)
+FULL = 0x1FF
+WIN_LINES = [0b000000111, 0b000111000, 0b111000000, # Linhas
+             0b001001001, 0b010010010, 0b100100100, # Colunas
+             0b100010001, 0b001010100]              # Diagonais
+
+# Tabelas com as 512 máscaras possíveis: vitória e número de peças numa só consulta
+WINS = [any(mask & line == line for line in WIN_LINES) for mask in range(512)]
+PIECES = [mask.bit_count() for mask in range(512)]
+# Parte do índice base 3 (positions.encode) correspondente às casas de uma máscara
+BASE3 = [sum(int(POW3[i]) for i in range(9) if mask >> i & 1) for mask in range(512)]
+SQUARES = [[i for i in range(9) if mask >> i & 1] for mask in range(512)]
+
+def to_masks(board):
+    """Tabuleiro 1/-1/0 -> (máscara do humano, máscara da IA)"""
+    human = ai = 0
+    for i, x in enumerate(board):
+        if x == HUMAN:
+            human |= 1 << i
+        elif x == AI:
+            ai |= 1 << i
+    return human, ai
+
+def board_index(human, ai):
+    """Índice base 3 (o mesmo de positions.encode) a partir das máscaras"""
+    return BASE3[human] + 2 * BASE3[ai]
+
+def check_win(board):
+    """Igual ao check_win original (HUMAN, AI, 0 se empate, None se continua), sem percorrer as linhas"""
+    human, ai = to_masks(board)
+    if WINS[human]: return HUMAN
+    if WINS[ai]: return AI
+    if human | ai == FULL: return 0
+    return None
+
+def _terminal(human, ai):
+    # Pontuações ajustadas pela profundidade (número de peças) para preferir
+    # vitórias rápidas e derrotas tardias, como no minimax original
+    if WINS[ai]:
+        return 100 - PIECES[human | ai]
+    if WINS[human]:
+        return -100 + PIECES[human | ai]
+    if human | ai == FULL:
+        return 0
+    return None
+
+class Solver:
+    """
+    Solver do jogo do galo sobre bitmasks, com memorização por posição
+    (tabela de transposições): cada posição é calculada uma única vez, seja
+    qual for a ordem de jogadas que lá chega. O valor é sempre do ponto de
+    vista da IA (maximiza) e depende só da posição e de quem joga.
+    solve() calcula valores exatos e a melhor jogada (para gerar as tabelas);
+    best_move() usa alpha-beta sobre a mesma memória para responder a uma
+    consulta avaliando o mínimo de posições.
+    """
+    def __init__(self):
+        self.values = {} # chave -> valor exato
+        self.moves = {} # chave -> melhor jogada da IA (só posições onde é a vez dela)
+        self.bounds = {} # chave -> (limite inferior, limite superior) do alpha-beta
+        self.nodes = 0 # Posições expandidas (fora da memória)
+
+    @staticmethod
+    def key(human, ai, ai_turn):
+        return (human << 9 | ai) << 1 | ai_turn
+
+    def solve(self, human, ai, ai_turn):
+        key = self.key(human, ai, ai_turn)
+        value = self.values.get(key)
+        if value is not None:
+            return value
+        self.nodes += 1
+
+        value = _terminal(human, ai)
+        if value is None:
+            empty = FULL & ~(human | ai)
+            if ai_turn:
+                value = -float('inf')
+                for sq in SQUARES[empty]:
+                    score = self.solve(human, ai | 1 << sq, False)
+                    # Em caso de empate fica a primeira jogada, como no minimax da app
+                    if score > value:
+                        value = score
+                        self.moves[key] = sq
+            else:
+                value = float('inf')
+                for sq in SQUARES[empty]:
+                    value = min(value, self.solve(human | 1 << sq, ai, True))
+        self.values[key] = value
+        return value
+
+    def alphabeta(self, human, ai, ai_turn, alpha=-float('inf'), beta=float('inf')):
+        key = self.key(human, ai, ai_turn)
+        value = self.values.get(key)
+        if value is not None:
+            return value
+        lower, upper = self.bounds.get(key, (-float('inf'), float('inf')))
+        if lower >= beta:
+            return lower
+        if upper <= alpha:
+            return upper
+        alpha, beta = max(alpha, lower), min(beta, upper)
+        self.nodes += 1
+
+        value = _terminal(human, ai)
+        if value is not None:
+            self.values[key] = value
+            return value
+
+        empty = FULL & ~(human | ai)
+        if ai_turn:
+            value = -float('inf')
+            a = alpha
+            for sq in SQUARES[empty]:
+                value = max(value, self.alphabeta(human, ai | 1 << sq, False, a, beta))
+                a = max(a, value)
+                if a >= beta:
+                    break
+        else:
+            value = float('inf')
+            b = beta
+            for sq in SQUARES[empty]:
+                value = min(value, self.alphabeta(human | 1 << sq, ai, True, alpha, b))
+                b = min(b, value)
+                if alpha >= b:
+                    break
+
+        # Fora da janela o resultado é só um limite para o valor real
+        if value <= alpha:
+            upper = value
+        elif value >= beta:
+            lower = value
+        else:
+            lower = upper = value
+        if lower == upper:
+            self.values[key] = value
+            self.bounds.pop(key, None)
+        else:
+            self.bounds[key] = (lower, upper)
+        return value
+
+    def best_move(self, board):
+        """
+        Melhor jogada da IA (a primeira em caso de empate, como o minimax da
+        app). Cada jogada é avaliada com a janela (melhor até agora, +inf):
+        as que não a podem superar são cortadas cedo.
+        """
+        human, ai = to_masks(board)
+        best_score, best = -float('inf'), None
+        for sq in SQUARES[FULL & ~(human | ai)]:
+            score = self.alphabeta(human, ai | 1 << sq, False, best_score, float('inf'))
+            if score > best_score:
+                best_score, best = score, sq
+        return best
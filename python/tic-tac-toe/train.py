@@ -1,79 +1,47 @@
+import time
 import numpy as np
-import pickle
+from positions import NUM_STATES, AI_TURN, HUMAN_TURN, MISSING, CANONICAL, save_table
+from solver import Solver, board_index, _terminal
 
-# Configurações
-AI_PIECE = -1  
-HUMAN_PIECE = 1 
-
-# Dicionário para armazenar a estratégia perfeita 
-policy = {}
-
-def check_win(board):
-    win_p = [[0,1,2],[3,4,5],[6,7,8],[0,3,6],[1,4,7],[2,5,8],[0,4,8],[2,4,6]]
-    for p in win_p:
-        s = board[p[0]] + board[p[1]] + board[p[2]]
-        if s == 3: return 1
-        if s == -3: return -1
-    if 0 not in board: return 0
-    return None
-
-def get_state_key(board):
-    return str(board.tolist())
-
-def minimax(board, depth, is_maximizing):
-    result = check_win(board)
-    # Pontuações ajustadas pela profundidade para preferir vitórias rápidas e derrotas tardias
-    if result == -1: 
-        return 100 - depth 
-    elif result == 1: 
-        return -100 + depth
-    elif result == 0: 
-        return 0
-
-    state_key = get_state_key(board)
-
-    if is_maximizing:
-        best_score = -float('inf')
-        avail = [i for i, x in enumerate(board) if x == 0]
-        for move in avail:
-            board[move] = AI_PIECE
-            score = minimax(board, depth + 1, False) 
-            board[move] = 0 
-            best_score = max(score, best_score)
-        # Guardamos o valor do estado onde é a vez da IA jogar
-        policy[state_key] = best_score
-        return best_score
-    
-    else:
-        # Turno do Humano
-        best_score = float('inf')
-        avail = [i for i, x in enumerate(board) if x == 0]
-        for move in avail:
-            board[move] = HUMAN_PIECE
-            score = minimax(board, depth + 1, True) 
-            board[move] = 0 
-            best_score = min(score, best_score)
-        # Guardamos o valor do estado onde é a vez do Humano jogar
-        policy[state_key] = best_score
-        return best_score
+# Tabelas para armazenar a estratégia perfeita, indexadas pelo tabuleiro em base 3:
+# o valor de cada posição (canónica, por jogador a jogar) e a melhor jogada da IA
+# em cada posição onde é a vez dela (usada pela app, sem simetria para o desempate
+# ser igual ao do minimax da app)
+policy = np.full((2, NUM_STATES), MISSING, dtype=np.int8)
+best_moves = np.full(NUM_STATES, -1, dtype=np.int8)
 
 def train():
     print("A calcular a estratégia perfeita...")
-    board = np.zeros(9, dtype=int)
+    start = time.perf_counter()
+    solver = Solver()
     
-    # Executa o algoritmo para todas as possibilidades
+    # Resolve o jogo a partir do tabuleiro vazio, para os dois casos:
     # 1. Caso o Humano comece
-    minimax(board, 0, False)
+    solver.solve(0, 0, False)
+    # 2. Caso a IA comece (as posições já vistas vêm da memória)
+    solver.solve(0, 0, True)
+
+    # Cada posição foi calculada uma única vez: passar os valores para as tabelas
+    for key, value in solver.values.items():
+        ai_turn = key & 1
+        human, ai = key >> 10, key >> 1 & 0x1FF
+        if _terminal(human, ai) is not None:
+            continue
+        index = board_index(human, ai)
+        policy[AI_TURN if ai_turn else HUMAN_TURN, CANONICAL[index]] = value
+        if ai_turn:
+            best_moves[index] = solver.moves[key]
+    seconds = time.perf_counter() - start
+
+    print(f"Mapeamento concluído em {seconds * 1e3:.0f} ms ({solver.nodes} posições visitadas)! "
+          f"{(policy != MISSING).sum()} posições canónicas memorizadas.")
     
-    # 2. Caso a IA comece
-    # O minimax acima já preenche quase tudo, mas para garantir o estado inicial da IA:
-    minimax(board, 0, True)
+    # Formato .npy: carregado pela app com memory-map, sem pickle nem cópias
+    save_table('policy.npy', policy)
+    print("Ficheiro 'policy.npy' gerado com sucesso.")
 
-    print(f"Mapeamento concluído! {len(policy)} posições memorizadas.")
-    
-    with open('policy.pkl', 'wb') as f:
-        pickle.dump(policy, f)
-    print("Ficheiro 'policy.pkl' gerado com sucesso.")
+    save_table('best_moves.npy', best_moves)
+    print(f"Ficheiro 'best_moves.npy' gerado com sucesso ({(best_moves >= 0).sum()} posições da IA).")
 
 if __name__ == "__main__":
-    train()
\ No newline at end of file
+    train()